@@ -0,0 +1,250 @@
+"""
+ASGI 入口
+大量取餐终端长时间保持连接（等待检测结果推送）时，线程模型下每个连接都要占用一个线程。
+本模块把 Flask 应用包装为 ASGI 应用，由事件循环持有连接：
+
+- /detect/jobs/<job_id>/events 直接在事件循环中推送任务状态，空闲连接不占用线程
+- /detect 同步请求在线程中完成校验和提交后即释放线程，推理、对齐和保存记录由任务队列执行，
+  事件循环等待任务结束后再次交给 Flask 生成响应（返回格式和响应头与同步模式一致）
+- 其余请求在固定大小的线程池中交给 Flask 处理；请求体和响应体都是流式传递的，
+  如 /weight_stream 的 NDJSON 上传可以边接收边处理
+
+用法:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import io
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import session
+
+from app import app, detection_jobs, preload_model
+from jobs import SSE_KEEPALIVE
+
+# 执行 Flask 视图的线程池，大小即同时处理的普通请求数上限
+wsgi_executor = ThreadPoolExecutor(max_workers=app.config['ASGI_WSGI_THREADS'],
+                                   thread_name_prefix='asgi-wsgi')
+
+JOB_EVENTS_PATH = re.compile(r'^/detect/jobs/([^/]+)/events$')
+
+
+def _app_path(scope: dict) -> str:
+    """去掉挂载前缀后的请求路径"""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    return path
+
+
+class _RequestBody(io.RawIOBase):
+    """在工作线程中按需从ASGI连接读取请求体，作为 wsgi.input"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                break
+            self._buffer = message.get('body', b'')
+            self._more = message.get('more_body', False)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _build_environ(scope: dict, body) -> dict:
+    """根据 ASGI HTTP 连接信息构建 WSGI environ"""
+    root_path = scope.get('root_path', '')
+    path = _app_path(scope)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # 没有 Content-Length 的请求（分块上传）读到连接上的请求体结束为止
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _cookie_name(set_cookie: str) -> str:
+    """Set-Cookie 响应头中的Cookie名"""
+    return set_cookie.split('=', 1)[0].strip()
+
+
+def _call_wsgi(environ: dict, send, loop):
+    """
+    在线程中执行 Flask 应用，响应体边生成边发送
+
+    视图把 /detect 提交为延迟返回的任务时（environ 中有 detect.job）不发送响应，
+    由调用方在任务结束后再次调用；第一次调用设置的Cookie（如会话更新）保存在
+    environ['detect.set_cookie'] 中，合并到第二次调用的响应里，同名Cookie以第二次为准。
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    result = app(environ, start_response)
+    try:
+        headers = response['headers']
+        if environ.get('detect.job') is not None:
+            environ['detect.set_cookie'] = [v for k, v in headers if k.lower() == 'set-cookie']
+            return
+        pending = environ.pop('detect.set_cookie', None)
+        if pending:
+            names = {_cookie_name(v) for k, v in headers if k.lower() == 'set-cookie'}
+            headers = headers + [('Set-Cookie', v) for v in pending
+                                 if _cookie_name(v) not in names]
+        send_sync({
+            'type': 'http.response.start',
+            'status': response['status'],
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers]
+        })
+        for chunk in result:
+            if chunk:
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        send_sync({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def _send_response(send, status: int, headers, body: bytes):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status: int, data: dict):
+    await _send_response(send, status, [('Content-Type', 'application/json')],
+                         app.json.dumps(data).encode('utf-8'))
+
+
+def _session_user(environ: dict):
+    """从 Flask 会话中读取当前登录的用户ID"""
+    with app.request_context(environ):
+        return session.get('user_id')
+
+
+async def _job_events(scope, send, job_id: str):
+    """在事件循环中推送检测任务状态，与 /detect/jobs/<job_id>/events 视图一致"""
+    user_id = _session_user(_build_environ(scope, io.BytesIO()))
+    if user_id is None:
+        await _send_json(send, 401, {'error': '请先登录'})
+        return
+    job = detection_jobs.get(job_id, owner=user_id)
+    if job is None:
+        await _send_json(send, 404, {'error': '任务不存在或已过期'})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')]
+    })
+    status = None
+    while True:
+        current = await detection_jobs.wait_async(job, status, timeout=15)
+        if current == status:
+            await send({'type': 'http.response.body',
+                        'body': SSE_KEEPALIVE.encode(), 'more_body': True})
+            continue
+        event, status = job.to_event()
+        finished = status in ('done', 'failed')
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'),
+                    'more_body': not finished})
+        if finished:
+            return
+
+
+async def _http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    path = _app_path(scope)
+    match = JOB_EVENTS_PATH.match(path)
+    if match and scope['method'] == 'GET':
+        await _job_events(scope, send, match.group(1))
+        return
+
+    environ = _build_environ(scope, io.BufferedReader(_RequestBody(receive, loop)))
+    if path == '/detect' and scope['method'] == 'POST':
+        # 让 /detect 把同步请求也提交为任务，由事件循环等待结果
+        environ['detect.defer'] = True
+    await loop.run_in_executor(wsgi_executor, _call_wsgi, environ, send, loop)
+
+    job = environ.pop('detect.job', None)
+    if job is None:
+        return
+    while not job.finished:
+        await detection_jobs.wait_async(job, job.status, timeout=60)
+    # 任务结束后再次调用 /detect，由 Flask 按正常流程生成响应
+    environ.update({'detect.result_job': job, 'wsgi.input': io.BytesIO(),
+                    'CONTENT_LENGTH': '0'})
+    await loop.run_in_executor(wsgi_executor, _call_wsgi, environ, send, loop)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if not app.config['MODEL_PRELOAD']:
+                preload_model()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI 应用"""
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
@@ -0,0 +1,102 @@
+"""
+检测菜品明细回填脚本
+为 detection_items 表上线之前保存的检测记录补写逐个菜品的结构化结果：
+按记录ID顺序分批读取检测结果JSON和对齐结果，拆分后批量写入。
+
+只处理还没有菜品明细的记录，可以重复运行或中断后重新运行。
+没有检测到菜品的记录不产生明细，按记录ID推进游标跳过，计入 empty。
+营养成分按当前的菜品营养数据计算。
+
+用法:
+    python backfill_items.py --chunk-size 1000
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import exists, insert
+
+
+def backfill_detection_items(chunk_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    回填检测菜品明细
+
+    Args:
+        chunk_size: 每批读取和写入的记录数
+        dry_run: 只统计不写入
+
+    Returns:
+        统计信息字典
+    """
+    from app import (app, db, DetectionAlignment, DetectionItem, DetectionRecord,
+                     build_detection_items)
+
+    stats = {'records': 0, 'items': 0, 'empty': 0, 'failed': 0}
+    started = time.monotonic()
+
+    with app.app_context():
+        missing = ~exists().where(DetectionItem.record_id == DetectionRecord.id)
+        total = DetectionRecord.query.filter(missing).count()
+        print(f"待回填记录: {total}")
+
+        last_id = 0
+        while True:
+            rows = db.session.query(
+                DetectionRecord.id,
+                DetectionRecord.user_id,
+                DetectionRecord.detection_time,
+                DetectionRecord.detected_objects,
+                DetectionAlignment.aligned_foods
+            ).outerjoin(
+                DetectionAlignment, DetectionAlignment.record_id == DetectionRecord.id
+            ).filter(
+                DetectionRecord.id > last_id, missing
+            ).order_by(DetectionRecord.id).limit(chunk_size).all()
+            if not rows:
+                break
+            # 游标按本批最大记录ID推进，不依赖是否写入了明细
+            last_id = rows[-1][0]
+
+            items = []
+            for record_id, user_id, detection_time, detected_objects, aligned_foods in rows:
+                try:
+                    record_items = build_detection_items(
+                        json.loads(detected_objects or '[]'),
+                        json.loads(aligned_foods) if aligned_foods else None)
+                except (ValueError, KeyError, TypeError):
+                    stats['failed'] += 1
+                    continue
+                if not record_items:
+                    stats['empty'] += 1
+                    continue
+                stats['records'] += 1
+                items.extend(dict(item, record_id=record_id, user_id=user_id,
+                                  detection_time=detection_time)
+                             for item in record_items)
+
+            stats['items'] += len(items)
+            if not dry_run:
+                if items:
+                    db.session.execute(insert(DetectionItem), items)
+                db.session.commit()
+            done = stats['records'] + stats['empty'] + stats['failed']
+            print(f"进度: {done}/{total}")
+
+    stats['elapsed_seconds'] = round(time.monotonic() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为已有检测记录回填菜品明细')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='每批记录数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不写入数据库')
+    args = parser.parse_args()
+
+    stats = backfill_detection_items(chunk_size=args.chunk_size, dry_run=args.dry_run)
+    print("回填完成:")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
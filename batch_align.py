@@ -0,0 +1,256 @@
+"""
+离线批量重新对齐脚本
+对齐参数调整后，按记录ID顺序流式读取历史检测结果和重量数据，
+在多个进程中并行执行视觉-重量对齐，并分批写回数据库。
+对齐结果、菜品明细（detection_items）和用户每日摄入（daily_intake）在同一事务中更新，
+三者始终一致。
+
+支持断点续跑：每批写回后记录进度，再次运行相同参数时从上次的位置继续；
+已经用相同参数对齐过的记录也会被跳过。
+
+用法:
+    python batch_align.py --spatial-weight 0.5 --temporal-weight 0.5 --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from weight_alignment import (VisualWeightAligner, aligned_to_dicts, events_from_json,
+                              foods_from_detections)
+
+DEFAULT_CHECKPOINT = os.path.join('results', 'batch_align_checkpoint.json')
+
+
+def align_chunk(params: dict, sort_direction: str, rows: list) -> list:
+    """
+    在工作进程中对齐一批记录
+
+    Args:
+        params: VisualWeightAligner 的构造参数
+        sort_direction: 空间排序方向
+        rows: [(记录ID, 检测结果JSON, 重量数据JSON)] 列表
+
+    Returns:
+        [(记录ID, 对齐结果列表或None)]，数据无法解析的记录结果为None
+    """
+    aligner = VisualWeightAligner(**params)
+    parsed = {}
+    for record_id, detected_objects, weight_data in rows:
+        try:
+            parsed[record_id] = (foods_from_detections(json.loads(detected_objects or '[]')),
+                                 events_from_json(json.loads(weight_data or '[]')))
+        except (ValueError, KeyError, TypeError, IndexError):
+            pass
+
+    try:
+        aligned = dict(zip(parsed, aligner.align_batch(list(parsed.values()), sort_direction)))
+    except (ValueError, KeyError, TypeError, IndexError):
+        # 批量对齐失败时逐条对齐，只把出错的记录标为失败
+        aligned = {}
+        for record_id, (foods, events) in parsed.items():
+            try:
+                aligned[record_id] = aligner.align(foods, events, sort_direction)
+            except (ValueError, KeyError, TypeError, IndexError):
+                pass
+
+    return [(record_id, aligned_to_dicts(aligned[record_id]) if record_id in aligned else None)
+            for record_id, _, _ in rows]
+
+
+def load_checkpoint(path: str, params_key: str) -> int:
+    """读取断点，参数不同时从头开始；返回已处理的最大记录ID"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get('params') != params_key:
+        return 0
+    return int(checkpoint.get('last_record_id', 0))
+
+
+def save_checkpoint(path: str, params_key: str, last_record_id: int, processed: int):
+    """原子地写入断点文件"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'params': params_key,
+            'last_record_id': last_record_id,
+            'processed': processed,
+            'updated_at': datetime.utcnow().isoformat()
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def run_batch_alignment(params: dict,
+                        sort_direction: str = 'left_to_right',
+                        workers: int = None,
+                        chunk_size: int = 500,
+                        checkpoint_path: str = DEFAULT_CHECKPOINT,
+                        restart: bool = False,
+                        dry_run: bool = False) -> dict:
+    """
+    批量重新对齐全部带重量数据的检测记录
+
+    Args:
+        params: VisualWeightAligner 的构造参数
+        sort_direction: 空间排序方向
+        workers: 工作进程数，默认CPU核心数
+        chunk_size: 每批读取和写回的记录数
+        checkpoint_path: 断点文件路径
+        restart: 忽略断点从头开始
+        dry_run: 只对齐不写回
+
+    Returns:
+        统计信息字典
+    """
+    from app import app, db, DetectionAlignment, DetectionRecord, replace_detection_items
+
+    # 与在线检测保存的格式一致：对齐参数 + 排序方向
+    params_key = json.dumps(
+        dict(VisualWeightAligner(**params).params(), sort_direction=sort_direction),
+        sort_keys=True)
+    workers = workers or os.cpu_count() or 1
+    start_id = 0 if restart else load_checkpoint(checkpoint_path, params_key)
+
+    stats = {'processed': 0, 'updated': 0, 'failed': 0}
+
+    with app.app_context():
+        base_query = db.session.query(
+            DetectionAlignment.record_id,
+            DetectionRecord.detected_objects,
+            DetectionAlignment.weight_data,
+            DetectionRecord.user_id,
+            DetectionRecord.detection_time
+        ).join(DetectionRecord, DetectionRecord.id == DetectionAlignment.record_id)
+
+        pending_filter = DetectionAlignment.record_id > start_id
+        if not restart:
+            # 已经用相同参数对齐过的记录无需重复处理
+            pending_filter = db.and_(pending_filter, db.or_(
+                DetectionAlignment.aligner_params.is_(None),
+                DetectionAlignment.aligner_params != params_key))
+        total = base_query.filter(pending_filter).count()
+        print(f"待对齐记录: {total}（从记录ID {start_id} 之后开始，{workers} 个进程）")
+
+        def read_chunks():
+            """按记录ID做键集分页，流式读取"""
+            last_id = start_id
+            while True:
+                rows = base_query.filter(
+                    DetectionAlignment.record_id > last_id, pending_filter
+                ).order_by(DetectionAlignment.record_id).limit(chunk_size).all()
+                if not rows:
+                    return
+                last_id = rows[-1][0]
+                yield rows
+
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            chunks = read_chunks()
+            exhausted = False
+            while in_flight or not exhausted:
+                # 保持每个进程都有任务，同时限制内存中的批次数
+                while not exhausted and len(in_flight) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    # 工作进程只需要检测结果和重量数据，用户和检测时间留在主进程更新明细时使用
+                    records = {r.record_id: r for r in chunk}
+                    in_flight.append((chunk[-1][0], records, executor.submit(
+                        align_chunk, params, sort_direction,
+                        [(r.record_id, r.detected_objects, r.weight_data) for r in chunk])))
+                if not in_flight:
+                    break
+
+                # 按提交顺序写回，保证断点之前的记录都已完成
+                last_record_id, records, future = in_flight.popleft()
+                results = future.result()
+                now = datetime.utcnow()
+                mappings = [{
+                    'record_id': record_id,
+                    'aligned_foods': json.dumps(aligned),
+                    'aligner_params': params_key,
+                    'aligned_at': now
+                } for record_id, aligned in results if aligned is not None]
+
+                stats['processed'] += len(results)
+                stats['failed'] += len(results) - len(mappings)
+                if not dry_run:
+                    db.session.bulk_update_mappings(DetectionAlignment, mappings)
+                    replace_detection_items([{
+                        'record_id': record_id,
+                        'user_id': records[record_id].user_id,
+                        'detection_time': records[record_id].detection_time,
+                        'detections': json.loads(records[record_id].detected_objects or '[]'),
+                        'aligned_foods': aligned
+                    } for record_id, aligned in results
+                        if aligned is not None and records[record_id].detection_time is not None])
+                    db.session.commit()
+                    save_checkpoint(checkpoint_path, params_key,
+                                    last_record_id, stats['processed'])
+                stats['updated'] += len(mappings)
+
+                elapsed = time.monotonic() - started
+                rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+                eta = (total - stats['processed']) / rate if rate > 0 else 0.0
+                print(f"进度: {stats['processed']}/{total} "
+                      f"({rate:.0f} 条/秒，预计剩余 {eta:.0f} 秒)")
+
+    stats['elapsed_seconds'] = round(time.monotonic() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量重新对齐历史检测记录')
+    parser.add_argument('--weight-tolerance', type=float, default=0.2)
+    parser.add_argument('--spatial-weight', type=float, default=0.6)
+    parser.add_argument('--temporal-weight', type=float, default=0.4)
+    parser.add_argument('--sort-direction', default='left_to_right',
+                        choices=['left_to_right', 'top_to_bottom', 'clockwise'])
+    parser.add_argument('--weight-model', default=None,
+                        help='重量回归模型文件（fit_weight_model.py 生成），默认与在线检测相同'
+                             '（WEIGHT_MODEL_PATH）；传入空字符串时按面积的固定比例估计')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每批记录数')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='断点文件路径')
+    parser.add_argument('--restart', action='store_true', help='忽略断点从头开始')
+    parser.add_argument('--dry-run', action='store_true', help='只对齐不写回数据库')
+    args = parser.parse_args()
+
+    from app import load_weight_model, weight_aligner
+    if args.weight_model is None:
+        weight_model = weight_aligner.weight_model
+    elif args.weight_model and not os.path.exists(args.weight_model):
+        parser.error(f'重量回归模型文件不存在: {args.weight_model}')
+    else:
+        weight_model = load_weight_model(args.weight_model)
+
+    stats = run_batch_alignment(
+        params={
+            'weight_tolerance': args.weight_tolerance,
+            'spatial_weight': args.spatial_weight,
+            'temporal_weight': args.temporal_weight,
+            'weight_model': weight_model
+        },
+        sort_direction=args.sort_direction,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+        dry_run=args.dry_run
+    )
+    print("对齐完成:")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+性能基准测试
+在临时的SQLite数据库（导入 databases/ 中的菜品营养数据）上测量关键路径的耗时：
+
+- detect: 用 Flask 测试客户端端到端调用 /detect（food_detection4/val_batch*.jpg 作为餐盘图片，
+  附带模拟的重量数据），需要模型权重文件，没有时跳过
+- align: VisualWeightAligner.align 在不同餐盘大小（菜品数）下的耗时
+- nutrition: NutritionCalculator.calculate_dish_nutrition
+- api_dishes: /api/dishes 的常用查询
+
+结果可以保存为基线文件，之后的运行与基线比较，中位数变慢超过阈值时以非零状态退出。
+基线与机器相关，请在同一台机器上保存和比较。
+
+用法:
+    python benchmark.py --save-baseline            # 运行并保存基线
+    python benchmark.py                            # 运行并与基线比较
+    python benchmark.py --only align nutrition --iterations 200
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCHMARKS = ('detect', 'align', 'nutrition', 'api_dishes')
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+# 导入到基准数据库的营养数据表（按外键依赖顺序）
+NUTRITION_DUMPS = ('canteens', 'ingredients', 'nutrition_facts', 'dishes', 'dish_ingredients')
+TRAY_SIZES = (2, 4, 8, 16)
+
+
+def _measure(fn, iterations: int, warmup: int) -> dict:
+    """
+    重复调用fn并统计耗时
+
+    Returns:
+        耗时统计（毫秒）
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples = np.array(samples)
+    return {
+        'iterations': iterations,
+        'mean_ms': round(float(samples.mean()), 4),
+        'median_ms': round(float(np.median(samples)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'min_ms': round(float(samples.min()), 4)
+    }
+
+
+def _load_sql_dump(connection, path: str):
+    """执行 mysqldump 导出文件中的 INSERT 语句（转换为SQLite可接受的转义）"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('INSERT INTO'):
+                connection.exec_driver_sql(line.replace("\\'", "''").replace('\\"', '"'))
+
+
+def prepare_database(dump_dir: str = 'databases'):
+    """创建表，菜品表为空时导入 databases/ 中的菜品营养数据（需要在应用上下文中调用）"""
+    from app import db, Dish
+
+    db.create_all()
+    if Dish.query.first() is None:
+        connection = db.session.connection()
+        for table in NUTRITION_DUMPS:
+            _load_sql_dump(connection, os.path.join(dump_dir, f'monisys_{table}.sql'))
+        db.session.commit()
+
+
+def setup_database(dump_dir: str = 'databases'):
+    """
+    准备基准测试数据库并创建基准测试用户
+
+    Returns:
+        基准测试用户的ID
+    """
+    from app import app, db, User
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        prepare_database(dump_dir)
+        user = User(username='bench', password_hash=generate_password_hash('bench'),
+                    height=170, weight=65, age=22, gender='男', health_goal='维持')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _synthetic_tray(rng: np.random.RandomState, size: int, names):
+    """生成一个餐盘的检测结果和对应的真实重量（菜品从左到右排列）"""
+    detections, weights = [], []
+    for i in range(size):
+        x1 = 40 + i * 90 + rng.uniform(0, 20)
+        y1 = rng.uniform(40, 200)
+        w, h = rng.uniform(50, 85), rng.uniform(50, 120)
+        detections.append({'class': names[i % len(names)],
+                           'confidence': float(rng.uniform(0.6, 0.99)),
+                           'bbox': [x1, y1, x1 + w, y1 + h]})
+        weights.append(float(rng.uniform(30, 200)))
+    return detections, weights
+
+
+def bench_align(iterations: int, warmup: int, seed: int = 0) -> dict:
+    """对齐算法在不同餐盘大小下的耗时"""
+    from weight_alignment import (VisualWeightAligner, WeightSensorSimulator,
+                                  foods_from_detections)
+
+    rng = np.random.RandomState(seed)
+    aligner = VisualWeightAligner()
+    simulator = WeightSensorSimulator(noise_level=1.0, seed=seed)
+    results = {}
+    for size in TRAY_SIZES:
+        detections, weights = _synthetic_tray(rng, size, [f'dish{i}' for i in range(size)])
+        foods = foods_from_detections(detections)
+        events = simulator.simulate_weight_sequence(weights)
+        results[f'align[{size}]'] = _measure(
+            lambda: aligner.align(foods, events), iterations, warmup)
+    return results
+
+
+def bench_nutrition(iterations: int, warmup: int) -> dict:
+    """单个菜品营养计算的耗时（轮流计算全部菜品）"""
+    from app import app, Dish, NutritionCalculator
+
+    with app.app_context():
+        names = [name for (name,) in Dish.query.with_entities(Dish.name)]
+        state = {'i': 0}
+
+        def run():
+            NutritionCalculator.calculate_dish_nutrition(names[state['i'] % len(names)], 150.0)
+            state['i'] += 1
+
+        return {'nutrition': _measure(run, iterations, warmup)}
+
+
+def bench_api_dishes(client, iterations: int, warmup: int) -> dict:
+    """菜品库接口的常用查询"""
+    queries = {
+        'api_dishes[list]': {},
+        'api_dishes[search]': {'q': '鸡蛋'},
+        'api_dishes[sort]': {'sort': 'energy_kcal', 'order': 'desc'},
+        'api_dishes[range]': {'min_protein_g': 10, 'max_energy_kcal': 500},
+    }
+    results = {}
+    for name, params in queries.items():
+        def run():
+            response = client.get('/api/dishes', query_string=params)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        results[name] = _measure(run, iterations, warmup)
+    return results
+
+
+def bench_detect(client, iterations: int, warmup: int, seed: int = 0) -> dict:
+    """/detect 端到端耗时（依次使用各张 val_batch 图片）"""
+    from app import detection_batcher
+    from weight_alignment import WeightSensorSimulator, events_to_json
+
+    if detection_batcher is None:
+        print("跳过 detect: 未找到模型权重文件")
+        return {}
+    images = sorted(glob.glob(os.path.join('food_detection4', 'val_batch*.jpg')))
+    if not images:
+        print("跳过 detect: 未找到 food_detection4/val_batch*.jpg")
+        return {}
+    payloads = []
+    for path in images:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+
+    simulator = WeightSensorSimulator(noise_level=1.0, seed=seed)
+    weight_data = json.dumps(events_to_json(
+        simulator.simulate_with_anomalies([85.0, 45.0, 120.0, 55.0], 'merged')))
+
+    results = {}
+    for mode in ('none', 'inline'):
+        state = {'i': 0}
+
+        def run():
+            data = {
+                'image': (io.BytesIO(payloads[state['i'] % len(payloads)]), 'tray.jpg'),
+                'weight_data': weight_data,
+                'image_mode': mode
+            }
+            state['i'] += 1
+            response = client.post('/detect', data=data, content_type='multipart/form-data')
+            assert response.status_code == 200, response.get_data(as_text=True)
+        results[f'detect[{mode}]'] = _measure(run, iterations, warmup)
+    return results
+
+
+def run_benchmarks(only=BENCHMARKS, iterations: int = 50, warmup: int = 5,
+                   detect_iterations: int = 10) -> dict:
+    """
+    运行基准测试
+
+    Args:
+        only: 要运行的基准测试
+        iterations: 每项测量的次数
+        warmup: 测量前的预热次数（/detect 的预热同时完成模型加载）
+        detect_iterations: /detect 每项测量的次数
+
+    Returns:
+        测试项 → 耗时统计
+    """
+    from app import app
+
+    user_id = setup_database()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    results = {}
+    if 'detect' in only:
+        results.update(bench_detect(client, detect_iterations, max(1, warmup // 2)))
+    if 'align' in only:
+        results.update(bench_align(iterations, warmup))
+    if 'nutrition' in only:
+        results.update(bench_nutrition(iterations, warmup))
+    if 'api_dishes' in only:
+        results.update(bench_api_dishes(client, iterations, warmup))
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float,
+            min_delta_ms: float = 0.05) -> list:
+    """
+    与基线比较中位数
+
+    Args:
+        results: 本次结果
+        baseline: 基线结果
+        threshold: 中位数变慢的比例阈值
+        min_delta_ms: 同时要求变慢的绝对值超过该毫秒数，避免亚毫秒级测试项的抖动误报
+
+    Returns:
+        变慢超过阈值的测试项列表 [(名称, 基线毫秒, 当前毫秒)]
+    """
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        delta = stats['median_ms'] - base['median_ms']
+        if delta > base['median_ms'] * threshold and delta > min_delta_ms:
+            regressions.append((name, base['median_ms'], stats['median_ms']))
+    return regressions
+
+
+def _environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'inference_runtime': os.environ.get('INFERENCE_RUNTIME', 'torch'),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='性能基准测试')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help='只运行指定的测试')
+    parser.add_argument('--iterations', type=int, default=50, help='每项测量次数')
+    parser.add_argument('--detect-iterations', type=int, default=10, help='/detect 每项测量次数')
+    parser.add_argument('--warmup', type=int, default=5, help='预热次数')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='中位数比基线慢多少（比例）视为性能回退')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                        help='变慢的绝对值不超过该毫秒数时不视为性能回退')
+    parser.add_argument('--output', default=None, help='把本次结果另存为JSON')
+    args = parser.parse_args()
+
+    # 必须在导入 app 之前设置：使用临时SQLite数据库，同步写入检测记录，关闭检测结果缓存
+    workdir = tempfile.mkdtemp(prefix='monisys-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['DETECT_WRITE_BEHIND'] = '0'
+    os.environ['DETECT_CACHE_SIZE'] = '0'
+    os.environ['MODEL_PRELOAD'] = '0'
+
+    results = run_benchmarks(args.only, args.iterations, args.warmup, args.detect_iterations)
+
+    print(f"\n{'测试项':<24}{'中位数ms':>12}{'p95 ms':>12}{'平均ms':>12}{'最小ms':>12}")
+    for name, stats in results.items():
+        print(f"{name:<26}{stats['median_ms']:>12.3f}{stats['p95_ms']:>12.3f}"
+              f"{stats['mean_ms']:>12.3f}{stats['min_ms']:>12.3f}")
+
+    report = {'environment': _environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\n没有基线文件 {args.baseline}，使用 --save-baseline 保存")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline['results'], args.threshold,
+                          args.min_delta_ms)
+    if regressions:
+        print(f"\n性能回退（中位数慢于基线 {args.threshold:.0%} 以上）:")
+        for name, base, current in regressions:
+            print(f"  {name}: {base:.3f}ms -> {current:.3f}ms")
+        sys.exit(1)
+    print(f"\n与基线 {args.baseline}（{baseline['environment']['created_at']}）相比没有性能回退")
+
+
+if __name__ == '__main__':
+    main()
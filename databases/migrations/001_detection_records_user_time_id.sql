@@ -0,0 +1,16 @@
+-- 检测历史键集分页使用的联合索引 (user_id, detection_time, id)
+-- db.create_all() 不会给已存在的表补建索引，已有数据库需要执行一次本脚本（可重复执行）
+--   mysql -u root -p monisys < databases/migrations/001_detection_records_user_time_id.sql
+
+SET @index_exists = (
+  SELECT COUNT(*) FROM information_schema.statistics
+  WHERE table_schema = DATABASE()
+    AND table_name = 'detection_records'
+    AND index_name = 'ix_detection_records_user_time_id'
+);
+SET @ddl = IF(@index_exists = 0,
+  'CREATE INDEX `ix_detection_records_user_time_id` ON `detection_records` (`user_id`, `detection_time`, `id`)',
+  'SELECT ''ix_detection_records_user_time_id already exists''');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -30,7 +30,8 @@ CREATE TABLE `detection_records` (
   `detection_time` datetime DEFAULT NULL,
   `notes` text COLLATE utf8mb4_unicode_ci,
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`)
+  KEY `user_id` (`user_id`),
+  KEY `ix_detection_records_user_time_id` (`user_id`,`detection_time`,`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=62 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
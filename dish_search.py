@@ -0,0 +1,126 @@
+"""
+菜品搜索索引
+基于汉字 n-gram 的内存倒排索引，支持前缀匹配、模糊匹配和相关度排序；
+安装了 pypinyin 时还会索引菜品名称的全拼和首字母（如 "hsr" 可搜到 "红烧肉"）
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+
+def _normalize(text: str) -> str:
+    """统一大小写并去掉空白"""
+    return ''.join((text or '').lower().split())
+
+
+def _ngrams(text: str, sizes: Tuple[int, ...]) -> List[str]:
+    """生成字符 n-gram（保留重复，用于计算查询的权重）"""
+    grams = []
+    for n in sizes:
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class DishSearchIndex:
+    """菜品名称搜索索引
+
+    索引构建后只读；菜品数据变化时重新构建一个新索引替换即可。
+    查询只访问查询串中出现的 n-gram 的倒排表，耗时与菜品总数基本无关。
+    """
+
+    def __init__(self, ngram_sizes: Tuple[int, ...] = (1, 2),
+                 min_score: float = 0.5):
+        """
+        Args:
+            ngram_sizes: 使用的 n-gram 长度
+            min_score: 模糊匹配时查询 n-gram 的最低命中比例（按IDF加权）
+        """
+        self.ngram_sizes = ngram_sizes
+        self.min_score = min_score
+        self._postings: Dict[str, set] = {}
+        self._fields: Dict[Hashable, List[str]] = {}
+        self._idf: Dict[str, float] = {}
+
+    def __len__(self):
+        return len(self._fields)
+
+    def _fields_of(self, name: str) -> List[str]:
+        """菜品名称本身以及（可用时）全拼和拼音首字母"""
+        text = _normalize(name)
+        fields = [text]
+        if lazy_pinyin is not None and text:
+            syllables = lazy_pinyin(text)
+            fields.append(''.join(syllables))
+            fields.append(''.join(s[0] for s in syllables if s))
+        return fields
+
+    def build(self, docs: Iterable[Tuple[Hashable, str]]):
+        """
+        构建索引
+
+        Args:
+            docs: (菜品ID, 菜品名称) 序列
+        """
+        postings = defaultdict(set)
+        fields = {}
+        for key, name in docs:
+            fields[key] = self._fields_of(name)
+            for field in fields[key]:
+                for gram in _ngrams(field, self.ngram_sizes):
+                    postings[gram].add(key)
+
+        total = max(1, len(fields))
+        self._idf = {gram: math.log(1 + total / len(keys))
+                     for gram, keys in postings.items()}
+        self._postings = dict(postings)
+        self._fields = fields
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[Hashable, float]]:
+        """
+        搜索菜品
+
+        Args:
+            query: 查询串（汉字、拼音或拼音首字母）
+            limit: 最多返回的结果数
+
+        Returns:
+            按相关度从高到低排序的 (菜品ID, 得分) 列表
+        """
+        q = _normalize(query)
+        if not q:
+            return []
+
+        grams = _ngrams(q, self.ngram_sizes) or [q]
+        # 查询中不存在于索引的 n-gram 也计入总权重，使错字较多的查询得分降低
+        max_idf = math.log(1 + max(1, len(self._fields)))
+        weights = [self._idf.get(g, max_idf) for g in grams]
+        total_weight = sum(weights)
+
+        scores = defaultdict(float)
+        for gram, weight in zip(grams, weights):
+            for key in self._postings.get(gram, ()):
+                scores[key] += weight
+
+        results = []
+        for key, matched in scores.items():
+            score = matched / total_weight
+            fields = self._fields[key]
+            if any(f == q for f in fields):
+                score += 2.0  # 完全匹配
+            elif any(f.startswith(q) for f in fields):
+                score += 1.0  # 前缀匹配
+            elif any(q in f for f in fields):
+                score += 0.5  # 连续子串匹配
+            elif score < self.min_score:
+                continue
+            # 同等匹配程度下名称越短越相关
+            score -= 0.01 * len(fields[0])
+            results.append((key, score))
+
+        results.sort(key=lambda item: -item[1])
+        return results[:limit]
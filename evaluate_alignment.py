@@ -0,0 +1,357 @@
+"""
+对齐参数评估脚本
+用 WeightSensorSimulator.simulate_batch 生成大规模带真值的模拟餐盘（含漏检、误检、合并异常），
+在多个进程中并行对 VisualWeightAligner 的参数组合做网格搜索，
+输出每组参数的匹配准确率、相对误差分布和吞吐量（餐盘/秒）。
+
+同一随机种子下所有参数组合使用完全相同的数据；数据按分块在工作进程中生成并缓存，
+不需要在进程间传输。
+
+用法:
+    python evaluate_alignment.py --trays 20000 --spatial-weight 0.4,0.5,0.6 \\
+        --temporal-weight 0.4,0.5,0.6 --sort-direction left_to_right,clockwise --workers 8
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from weight_alignment import (ANOMALY_CODES, DetectedFood, VisualWeightAligner,
+                              WeightSensorSimulator)
+
+SORT_DIRECTIONS = ('left_to_right', 'top_to_bottom', 'clockwise')
+
+# 模拟餐盘上菜品的摆放方式，取菜顺序分别对应从左到右、从上到下、顺时针
+LAYOUTS = ('row', 'column', 'ring')
+
+# 相对误差分位数
+ERROR_PERCENTILES = (50, 90, 99)
+
+# 与 VisualWeightAligner._estimate_weights_from_areas 的简化模型一致（克/像素²）
+DENSITY_FACTOR = 0.1
+
+IMAGE_SIZE = (640, 480)
+
+
+def _tray_foods(rng: np.random.Generator, weights: np.ndarray, layout: str,
+                layout_jitter: float, area_noise: float) -> List[DetectedFood]:
+    """
+    按取菜顺序生成一个餐盘的检测结果
+
+    class_name 为菜品在取菜顺序中的序号，用于和真值对应。
+
+    Args:
+        weights: 该餐盘各菜品的真实重量（按取菜顺序）
+        layout: 摆放方式
+        layout_jitter: 位置扰动（相对于相邻菜品间距），越大越容易与取菜顺序不一致
+        area_noise: 面积的对数正态噪声标准差
+    """
+    n = len(weights)
+    width, height = IMAGE_SIZE
+    slots = np.arange(n) + 0.5 + rng.normal(0, layout_jitter, n)
+    if layout == 'row':
+        cx = slots / n * width
+        cy = rng.uniform(0.3, 0.7, n) * height
+    elif layout == 'column':
+        cx = rng.uniform(0.3, 0.7, n) * width
+        cy = slots / n * height
+    else:
+        # 从 -π 开始顺时针（图像坐标y轴向下，arctan2递增即顺时针）
+        angle = -np.pi + slots / n * 2 * np.pi
+        cx = width / 2 + np.cos(angle) * width * 0.35
+        cy = height / 2 + np.sin(angle) * height * 0.35
+    areas = weights / DENSITY_FACTOR * rng.lognormal(0, area_noise, n)
+    half = np.sqrt(areas) / 2
+
+    return [DetectedFood(
+        class_name=str(j),
+        bbox=[float(cx[j] - half[j]), float(cy[j] - half[j]),
+              float(cx[j] + half[j]), float(cy[j] + half[j])],
+        confidence=1.0,
+        center_x=float(cx[j]),
+        center_y=float(cy[j]),
+        area=float(areas[j])
+    ) for j in range(n)]
+
+
+@lru_cache(maxsize=8)
+def generate_chunk(dataset: Tuple, chunk_index: int):
+    """
+    生成（并在当前进程中缓存）一个数据分块
+
+    Args:
+        dataset: 数据集参数，见 dataset_config() 的返回值
+        chunk_index: 分块序号，与种子一起决定随机数
+
+    Returns:
+        (WeightBatch, 各餐盘的检测结果列表, 各餐盘的摆放方式)
+    """
+    config = dict(dataset)
+    rng = np.random.default_rng([config['seed'], chunk_index])
+    simulator = WeightSensorSimulator(noise_level=config['noise_level'],
+                                      seed=[config['seed'], chunk_index, 1])
+    n_trays = min(config['chunk_size'],
+                  config['trays'] - chunk_index * config['chunk_size'])
+    food_weights, n_foods = simulator.random_food_weights(
+        n_trays, config['min_foods'], config['max_foods'])
+    batch = simulator.simulate_batch(food_weights, n_foods, dict(config['anomaly_probs']))
+
+    layouts = rng.choice(config['layouts'], n_trays)
+    foods = [_tray_foods(rng, food_weights[i, :n_foods[i]], layouts[i],
+                         config['layout_jitter'], config['area_noise'])
+             for i in range(n_trays)]
+    return batch, foods, layouts
+
+
+def dataset_config(trays: int, chunk_size: int, seed: int = 0,
+                   min_foods: int = 2, max_foods: int = 6,
+                   anomaly_probs: Dict[str, float] = None,
+                   layouts=('row',), noise_level: float = 1.0,
+                   layout_jitter: float = 0.15, area_noise: float = 0.3) -> Tuple:
+    """数据集参数（可哈希，用作工作进程中数据分块的缓存键）"""
+    if anomaly_probs is None:
+        anomaly_probs = {'missing': 0.1, 'extra': 0.1, 'merged': 0.1}
+    return tuple(sorted({
+        'trays': trays,
+        'chunk_size': chunk_size,
+        'seed': seed,
+        'min_foods': min_foods,
+        'max_foods': max_foods,
+        'anomaly_probs': tuple(sorted(anomaly_probs.items())),
+        'layouts': tuple(layouts),
+        'noise_level': noise_level,
+        'layout_jitter': layout_jitter,
+        'area_noise': area_noise
+    }.items()))
+
+
+def evaluate_chunk(params: dict, sort_direction: str, dataset: Tuple,
+                   chunk_index: int) -> dict:
+    """
+    在工作进程中用一组参数对齐一个数据分块，并与真值比较
+
+    对齐结果中菜品匹配到的重量事件包含该菜品（合并事件包含两个菜品）即视为正确。
+
+    Returns:
+        分块的统计结果，相对误差以数组返回，由主进程汇总分位数
+    """
+    batch, trays_foods, _ = generate_chunk(dataset, chunk_index)
+    aligner = VisualWeightAligner(**params)
+    events = [batch.events(i) for i in range(len(batch))]
+
+    started = time.perf_counter()
+    results = aligner.align_batch(list(zip(trays_foods, events)), sort_direction)
+    align_seconds = time.perf_counter() - started
+
+    n_anomalies = len(ANOMALY_CODES)
+    foods_by_anomaly = np.zeros(n_anomalies, dtype=int)
+    correct_by_anomaly = np.zeros(n_anomalies, dtype=int)
+    matched = 0
+    errors = []
+    for i, aligned in enumerate(results):
+        n_events = int(batch.n_events[i])
+        # weight_event_index 对应过滤噪声后的增量序号（+1），换算回事件列
+        event_columns = np.flatnonzero(batch.deltas[i, 1:n_events] > 0.5) + 1
+        first_food = batch.event_food[i]
+        food_count = batch.event_food_count[i]
+        anomaly = batch.anomaly[i]
+        foods_by_anomaly[anomaly] += len(aligned)
+        for a in aligned:
+            j = int(a.food.class_name)
+            truth = batch.true_weights[i, j]
+            errors.append(abs(a.weight - truth) / truth)
+            if a.weight_event_index < 0:
+                continue
+            matched += 1
+            column = event_columns[a.weight_event_index - 1]
+            if first_food[column] <= j < first_food[column] + food_count[column]:
+                correct_by_anomaly[anomaly] += 1
+
+    return {
+        'trays': len(batch),
+        'foods': int(foods_by_anomaly.sum()),
+        'matched': matched,
+        'correct': int(correct_by_anomaly.sum()),
+        'foods_by_anomaly': foods_by_anomaly,
+        'correct_by_anomaly': correct_by_anomaly,
+        'errors': np.asarray(errors, dtype=np.float32),
+        'align_seconds': align_seconds
+    }
+
+
+def summarize(chunks: List[dict]) -> dict:
+    """汇总一组参数在全部分块上的结果"""
+    foods = sum(c['foods'] for c in chunks)
+    trays = sum(c['trays'] for c in chunks)
+    align_seconds = sum(c['align_seconds'] for c in chunks)
+    errors = np.concatenate([c['errors'] for c in chunks]) if chunks else np.zeros(0)
+    no_foods = np.zeros(len(ANOMALY_CODES), dtype=int)
+    foods_by_anomaly = sum((c['foods_by_anomaly'] for c in chunks), no_foods)
+    correct_by_anomaly = sum((c['correct_by_anomaly'] for c in chunks), no_foods)
+
+    summary = {
+        'trays': trays,
+        'foods': foods,
+        'accuracy': round(sum(c['correct'] for c in chunks) / foods, 4) if foods else 0.0,
+        'matched_rate': round(sum(c['matched'] for c in chunks) / foods, 4) if foods else 0.0,
+        'accuracy_by_anomaly': {
+            name: round(int(correct_by_anomaly[code]) / int(foods_by_anomaly[code]), 4)
+            for name, code in ANOMALY_CODES.items() if foods_by_anomaly[code]
+        },
+        'mean_relative_error': round(float(errors.mean()), 4) if errors.size else None,
+        # 单个进程的对齐吞吐量（不含数据生成）
+        'trays_per_second': round(trays / align_seconds, 1) if align_seconds > 0 else None
+    }
+    if errors.size:
+        for q, value in zip(ERROR_PERCENTILES, np.percentile(errors, ERROR_PERCENTILES)):
+            summary[f'p{q}_relative_error'] = round(float(value), 4)
+        summary['max_relative_error'] = round(float(errors.max()), 4)
+    return summary
+
+
+def run_sweep(grid: List[Tuple[dict, str]], dataset: Tuple, workers: int = None) -> List[dict]:
+    """
+    并行评估全部参数组合
+
+    Args:
+        grid: [(VisualWeightAligner 的构造参数, 排序方向)] 列表
+        dataset: dataset_config() 的返回值
+        workers: 工作进程数，默认CPU核心数
+
+    Returns:
+        每组参数的汇总结果，按准确率从高到低排列
+    """
+    config = dict(dataset)
+    n_chunks = -(-config['trays'] // config['chunk_size'])
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(grid)} 组参数 × {config['trays']} 个餐盘（{n_chunks} 个分块，{workers} 个进程）")
+
+    chunks = [[] for _ in grid]
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 按分块优先的顺序提交，让每个进程尽量复用已生成的数据分块
+        futures = {
+            executor.submit(evaluate_chunk, params, sort_direction, dataset, chunk_index): g
+            for chunk_index in range(n_chunks)
+            for g, (params, sort_direction) in enumerate(grid)
+        }
+        done = 0
+        for future in as_completed(futures):
+            chunks[futures[future]].append(future.result())
+            done += 1
+            if done % max(1, len(futures) // 10) == 0 or done == len(futures):
+                print(f"进度: {done}/{len(futures)} ({time.monotonic() - started:.1f} 秒)")
+    elapsed = time.monotonic() - started
+
+    results = []
+    for (params, sort_direction), parts in zip(grid, chunks):
+        summary = dict(params, sort_direction=sort_direction)
+        summary.update(summarize(parts))
+        results.append(summary)
+    # 没有误差数据的组合排在同准确率的最后
+    results.sort(key=lambda r: (-r['accuracy'], r['mean_relative_error'] is None,
+                                r['mean_relative_error'] or 0.0))
+
+    total_trays = config['trays'] * len(grid)
+    print(f"完成: {elapsed:.1f} 秒，共 {total_trays / elapsed:.0f} 餐盘/秒")
+    return results
+
+
+def _cell(value, width: int, digits: int = 3) -> str:
+    """表格单元格，没有数据（None）时显示为 -"""
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+
+
+def print_report(results: List[dict], top: int = 20):
+    """打印结果表（按准确率排序），没有菜品或误差数据的指标显示为 -"""
+    header = (f"{'spatial':>7} {'temporal':>8} {'direction':<14} "
+              f"{'acc':>6} {'matched':>7} {'mean_err':>8} {'p50':>6} {'p90':>6} "
+              f"{'p99':>6} {'trays/s':>8}  按异常类型的准确率")
+    print(header)
+    print('-' * len(header))
+    for r in results[:top]:
+        by_anomaly = ' '.join(f"{k}={v:.3f}" for k, v in r['accuracy_by_anomaly'].items())
+        print(f"{r['spatial_weight']:>7.2f} {r['temporal_weight']:>8.2f} "
+              f"{r['sort_direction']:<14} "
+              f"{_cell(r['accuracy'] if r['foods'] else None, 6)} "
+              f"{_cell(r['matched_rate'] if r['foods'] else None, 7)} "
+              f"{_cell(r['mean_relative_error'], 8)} {_cell(r.get('p50_relative_error'), 6)} "
+              f"{_cell(r.get('p90_relative_error'), 6)} {_cell(r.get('p99_relative_error'), 6)} "
+              f"{_cell(r['trays_per_second'], 8, 0)}  {by_anomaly}")
+
+
+def _floats(text: str) -> List[float]:
+    return [float(v) for v in text.split(',') if v.strip()]
+
+
+def _choices(allowed):
+    def parse(text: str) -> List[str]:
+        values = [v.strip() for v in text.split(',') if v.strip()]
+        for v in values:
+            if v not in allowed:
+                raise argparse.ArgumentTypeError(f"{v} 不在 {', '.join(allowed)} 中")
+        return values
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在模拟数据上评估视觉-重量对齐参数')
+    parser.add_argument('--spatial-weight', type=_floats, default=[0.6],
+                        help='逗号分隔的候选值')
+    parser.add_argument('--temporal-weight', type=_floats, default=[0.4],
+                        help='逗号分隔的候选值')
+    parser.add_argument('--sort-direction', type=_choices(SORT_DIRECTIONS),
+                        default=['left_to_right'], help='逗号分隔的候选值')
+    parser.add_argument('--trays', type=int, default=10000, help='模拟餐盘数')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='每个任务的餐盘数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--min-foods', type=int, default=2)
+    parser.add_argument('--max-foods', type=int, default=6)
+    parser.add_argument('--missing', type=float, default=0.1, help='漏检概率')
+    parser.add_argument('--extra', type=float, default=0.1, help='误检概率')
+    parser.add_argument('--merged', type=float, default=0.1, help='合并概率')
+    parser.add_argument('--layouts', type=_choices(LAYOUTS), default=['row'],
+                        help='菜品摆放方式，逗号分隔；多种时每个餐盘随机选择')
+    parser.add_argument('--noise-level', type=float, default=1.0, help='重量噪声（克）')
+    parser.add_argument('--layout-jitter', type=float, default=0.15,
+                        help='摆放位置扰动（相对于菜品间距）')
+    parser.add_argument('--area-noise', type=float, default=0.3, help='面积-重量关系的对数噪声')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数')
+    parser.add_argument('--top', type=int, default=20, help='打印前N组结果')
+    parser.add_argument('--output', default=None, help='把全部结果保存为JSON')
+    args = parser.parse_args()
+
+    dataset = dataset_config(
+        trays=args.trays,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        min_foods=args.min_foods,
+        max_foods=args.max_foods,
+        anomaly_probs={'missing': args.missing, 'extra': args.extra, 'merged': args.merged},
+        layouts=args.layouts,
+        noise_level=args.noise_level,
+        layout_jitter=args.layout_jitter,
+        area_noise=args.area_noise
+    )
+    grid = [({'spatial_weight': sw, 'temporal_weight': tw}, direction)
+            for sw, tw, direction in itertools.product(
+                args.spatial_weight, args.temporal_weight, args.sort_direction)]
+
+    results = run_sweep(grid, dataset, args.workers)
+    print_report(results, args.top)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'dataset': dict(dataset), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
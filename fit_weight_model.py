@@ -0,0 +1,148 @@
+"""
+重量回归模型拟合脚本
+从历史对齐结果中取出已匹配到重量事件、置信度足够高的菜品，
+按类别拟合 面积、宽高比、原图面积 → 重量 的回归模型，保存为在线对齐使用的 .npz 文件。
+
+留出一部分餐盘做验证，与当前模型（默认为按面积的固定比例）比较平均相对误差。
+检测结果中带有 class_id 时按YOLO类别ID排列系数，否则按类别名排序。
+
+用法:
+    python fit_weight_model.py --min-confidence 0.6 --output results/weight_model.npz
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from weight_alignment import AreaWeightModel, DetectedFood, foods_from_detections
+
+
+def collect_samples(min_confidence: float = 0.5, chunk_size: int = 2000,
+                    limit: int = None) -> Tuple[List[Tuple[int, DetectedFood, float]], Dict[int, str]]:
+    """
+    读取历史对齐结果中的训练样本
+
+    Args:
+        min_confidence: 对齐置信度下限，低于该值的匹配不作为样本
+        chunk_size: 每批读取的记录数
+        limit: 最多读取的记录数
+
+    Returns:
+        tuple: ([(记录ID, 菜品, 重量)], {YOLO类别ID: 类别名})
+    """
+    from app import app, db, DetectionAlignment, DetectionRecord
+
+    samples = []
+    class_names = {}
+    with app.app_context():
+        last_id = 0
+        read = 0
+        while limit is None or read < limit:
+            rows = db.session.query(
+                DetectionAlignment.record_id,
+                DetectionRecord.detected_objects,
+                DetectionAlignment.aligned_foods
+            ).join(DetectionRecord, DetectionRecord.id == DetectionAlignment.record_id).filter(
+                DetectionAlignment.record_id > last_id,
+                DetectionAlignment.aligned_foods.isnot(None)
+            ).order_by(DetectionAlignment.record_id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            read += len(rows)
+
+            for record_id, detected_objects, aligned_foods in rows:
+                try:
+                    detections = json.loads(detected_objects or '[]')
+                    aligned = json.loads(aligned_foods or '[]')
+                except ValueError:
+                    continue
+                # 对齐结果中只有类别名和边界框，类别ID和原图尺寸从检测结果中取
+                by_box = {(d['class'], tuple(d['bbox'])): d for d in detections}
+                for d in detections:
+                    if d.get('class_id', -1) >= 0:
+                        class_names[int(d['class_id'])] = d['class']
+                for a in aligned:
+                    if not a.get('matched') or a.get('confidence', 0) < min_confidence:
+                        continue
+                    det = by_box.get((a['class'], tuple(a['bbox'])),
+                                     {'class': a['class'], 'confidence': 1.0, 'bbox': a['bbox']})
+                    food = foods_from_detections([det])[0]
+                    samples.append((record_id, food, float(a['weight'])))
+            print(f"已读取 {read} 条记录，{len(samples)} 个样本")
+    return samples, class_names
+
+
+def class_name_order(samples, class_names: Dict[int, str]) -> List[str]:
+    """按YOLO类别ID排列的类别名；没有ID的类别排在最后"""
+    names = [''] * (max(class_names) + 1 if class_names else 0)
+    for class_id, name in class_names.items():
+        names[class_id] = name
+    known = set(names)
+    names.extend(sorted({food.class_name for _, food, _ in samples} - known))
+    return names
+
+
+def relative_errors(model: AreaWeightModel, samples) -> np.ndarray:
+    if not samples:
+        return np.zeros(0)
+    predicted = model.predict([food for _, food, _ in samples])
+    actual = np.array([w for _, _, w in samples])
+    return np.abs(predicted - actual) / actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从历史对齐结果拟合按菜品的重量回归模型')
+    parser.add_argument('--min-confidence', type=float, default=0.5,
+                        help='只使用对齐置信度不低于该值的匹配')
+    parser.add_argument('--min-samples', type=int, default=10,
+                        help='单独拟合一个类别所需的最少样本数')
+    parser.add_argument('--ridge', type=float, default=5.0,
+                        help='各类别系数向共用系数收缩的强度')
+    parser.add_argument('--holdout', type=float, default=0.2, help='留作验证的餐盘比例')
+    parser.add_argument('--limit', type=int, default=None, help='最多读取的记录数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join('results', 'weight_model.npz'))
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    samples, class_names = collect_samples(args.min_confidence, limit=args.limit)
+    if not samples:
+        print("没有可用的样本（需要带重量数据且已匹配的检测记录）")
+        return
+
+    # 按餐盘划分训练集和验证集，避免同一餐盘的菜品同时出现在两边
+    record_ids = np.unique([record_id for record_id, _, _ in samples])
+    rng = np.random.default_rng(args.seed)
+    holdout_ids = set(rng.choice(record_ids, int(len(record_ids) * args.holdout),
+                                 replace=False).tolist())
+    train = [s for s in samples if s[0] not in holdout_ids]
+    test = [s for s in samples if s[0] in holdout_ids]
+
+    names = class_name_order(samples, class_names)
+    model = AreaWeightModel.fit([(food, w) for _, food, w in train], names,
+                                min_samples=args.min_samples, ridge=args.ridge)
+
+    from app import app, load_weight_model
+    current = load_weight_model(app.config['WEIGHT_MODEL_PATH']) or AreaWeightModel()
+    fitted_classes = sum(1 for row in range(len(names))
+                         if not np.allclose(model.coef[row], model.coef[-1]))
+    print(f"样本: 训练 {len(train)}，验证 {len(test)}；{len(names)} 个类别，"
+          f"{fitted_classes} 个单独拟合")
+    for label, m in (('当前模型', current), ('新模型', model)):
+        errors = relative_errors(m, test or train)
+        if errors.size:
+            print(f"  {label}: 平均相对误差 {errors.mean():.3f}，"
+                  f"中位数 {np.median(errors):.3f}，P90 {np.percentile(errors, 90):.3f}")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    model.save(args.output)
+    print(f"模型已保存: {args.output}（版本 {model.version}，{os.path.getsize(args.output)} 字节，"
+          f"用时 {time.monotonic() - started:.1f} 秒）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,760 @@
+"""
+YOLO推理服务
+将多个并发请求的图片合并为一个批次送入模型，减少逐张调用的开销；
+可选地把推理放到独立的工作进程池中执行，与Flask请求线程解耦；
+模型在首次使用时才加载，并可导出为ONNX/OpenVINO格式以降低CPU推理延迟；
+标注图片只在调用方需要时才绘制；近似重复的图片直接复用缓存的检测结果
+"""
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # 非POSIX系统没有文件锁，导出只在进程内互斥
+    fcntl = None
+
+# 支持的推理运行时：torch 直接加载 .pt；onnx / openvino 使用由同一份 .pt 导出的模型
+SUPPORTED_RUNTIMES = ('torch', 'onnx', 'openvino')
+
+
+def exported_model_path(weights_path: str, runtime: str) -> str:
+    """返回指定运行时对应的导出模型路径（与ultralytics导出的命名规则一致）"""
+    stem, _ = os.path.splitext(weights_path)
+    if runtime == 'onnx':
+        return stem + '.onnx'
+    if runtime == 'openvino':
+        return stem + '_openvino_model'
+    return weights_path
+
+
+def export_model(weights_path: str, runtime: str, imgsz: int = 640) -> str:
+    """
+    将 .pt 权重导出为CPU运行时格式，导出结果比权重文件新时直接复用
+
+    Args:
+        weights_path: .pt 权重路径
+        runtime: 'onnx' 或 'openvino'
+        imgsz: 导出时的输入尺寸，需与训练尺寸一致
+
+    Returns:
+        导出模型的路径
+    """
+    target = exported_model_path(weights_path, runtime)
+
+    def up_to_date():
+        return os.path.exists(target) and \
+            os.path.getmtime(target) >= os.path.getmtime(weights_path)
+
+    if up_to_date():
+        return target
+
+    # 多个服务进程同时启动时只由一个进程导出，其余进程等待导出完成后直接使用，
+    # 不会读到写了一半的文件
+    with _export_lock:
+        lock_file = open(target + '.lock', 'a') if fcntl is not None else None
+        try:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if up_to_date():
+                return target
+
+            from ultralytics import YOLO
+
+            # dynamic=True 保留可变的batch维度，合批推理时才能一次送入多张图片
+            exported = YOLO(weights_path).export(
+                format=runtime, imgsz=imgsz, dynamic=True)
+            return str(exported or target)
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+
+_export_lock = threading.Lock()
+
+
+def load_model(weights_path: str,
+               runtime: str = 'torch',
+               imgsz: int = 640,
+               warmup: bool = True):
+    """
+    加载YOLO模型并可选地执行一次预热推理
+
+    Args:
+        weights_path: .pt 权重路径
+        runtime: 推理运行时，见 SUPPORTED_RUNTIMES
+        imgsz: 输入尺寸
+        warmup: 是否用空白图片预热，使首个真实请求不再承担初始化开销
+
+    Returns:
+        YOLO模型
+    """
+    if runtime not in SUPPORTED_RUNTIMES:
+        raise ValueError(f'不支持的推理运行时: {runtime}')
+
+    path = weights_path
+    if runtime != 'torch':
+        path = export_model(weights_path, runtime, imgsz)
+    return _load_yolo(path, imgsz, warmup)
+
+
+def _load_yolo(path: str, imgsz: int, warmup: bool):
+    """加载 .pt 或已导出的模型（由文件类型决定推理后端），可选地预热"""
+    from ultralytics import YOLO
+
+    model = YOLO(path, task='detect')
+    if warmup:
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+    return model
+
+
+class LazyModel:
+    """延迟加载的模型
+
+    导入本模块不会加载torch/ultralytics；第一次调用 get() 或 preload() 时才加载，
+    多个线程同时请求时只加载一次。
+    """
+
+    def __init__(self,
+                 weights_path: str,
+                 runtime: str = 'torch',
+                 imgsz: int = 640,
+                 warmup: bool = True):
+        """
+        Args:
+            weights_path: .pt 权重路径
+            runtime: 推理运行时，见 SUPPORTED_RUNTIMES
+            imgsz: 输入尺寸
+            warmup: 加载后是否执行预热推理
+        """
+        self.weights_path = weights_path
+        self.runtime = runtime
+        self.imgsz = imgsz
+        self.warmup = warmup
+        self.error = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """权重文件是否存在"""
+        return os.path.exists(self.weights_path)
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def version(self) -> str:
+        """模型版本标识（运行时 + 权重文件修改时间和大小），权重更新后随之变化"""
+        try:
+            stat = os.stat(self.weights_path)
+            return f'{self.runtime}:{int(stat.st_mtime)}:{stat.st_size}'
+        except OSError:
+            return f'{self.runtime}:missing'
+
+    def get(self):
+        """返回已加载的模型，必要时先加载"""
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                try:
+                    self._model = load_model(
+                        self.weights_path, self.runtime, self.imgsz, self.warmup)
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    raise RuntimeError(f'模型加载失败: {e}') from e
+        return self._model
+
+    def preload(self, background: bool = True):
+        """
+        提前加载并预热模型
+
+        Args:
+            background: 是否在后台线程中加载，不阻塞服务启动
+        """
+        def _load():
+            try:
+                self.get()
+            except RuntimeError as e:
+                print(f"警告: {e}")
+
+        if background:
+            threading.Thread(target=_load, name='yolo-preload',
+                             daemon=True).start()
+        else:
+            _load()
+
+
+def extract_detections(result) -> List[dict]:
+    """
+    从YOLO单张图片的结果中提取检测框信息
+
+    Returns:
+        检测结果列表，每项包含 class、class_id、confidence、bbox 和 image_size（[宽, 高]）
+    """
+    orig_shape = getattr(result, 'orig_shape', None)
+    image_size = [int(orig_shape[1]), int(orig_shape[0])] if orig_shape is not None else None
+    detections = []
+    for box in result.boxes:
+        class_id = int(box.cls[0])
+        detections.append({
+            'class': result.names[class_id],
+            'class_id': class_id,
+            'confidence': float(box.conf[0]),
+            'bbox': box.xyxy[0].tolist(),
+            'image_size': image_size
+        })
+    return detections
+
+
+def predict_batch(model, images: list, render: List[bool] = None) -> List[dict]:
+    """
+    对一批图片执行一次YOLO推理
+
+    Args:
+        model: YOLO模型
+        images: BGR格式的图片列表
+        render: 与images一一对应，是否绘制标注图片，默认全部绘制
+
+    Returns:
+        与images一一对应的结果列表，每项包含 detections、annotated
+        （标注后的图片，不需要绘制时为None）和 timings（各阶段耗时，秒）
+    """
+    if render is None:
+        render = [True] * len(images)
+    results = model(images, verbose=False)
+    outputs = []
+    for result, need_plot in zip(results, render):
+        # YOLO按批次统计的预处理、推理、后处理耗时（已平均到每张图片，毫秒）
+        speed = getattr(result, 'speed', None) or {}
+        timings = {f'yolo_{k}': v / 1000.0 for k, v in speed.items() if v is not None}
+        annotated = None
+        if need_plot:
+            started = time.perf_counter()
+            annotated = result.plot()
+            timings['plot'] = time.perf_counter() - started
+        outputs.append({
+            'detections': extract_detections(result),
+            'annotated': annotated,
+            'timings': timings
+        })
+    return outputs
+
+
+def encode_jpeg(img, quality: int = 90, max_side: int = 0) -> bytes:
+    """
+    将图片编码为JPEG
+
+    Args:
+        img: BGR图片
+        quality: JPEG质量（1-100）
+        max_side: 长边的最大像素数，超过时等比缩小，0表示保持原尺寸
+
+    Returns:
+        JPEG字节串
+    """
+    if max_side and max(img.shape[:2]) > max_side:
+        scale = max_side / max(img.shape[:2])
+        img = cv2.resize(img, None, fx=scale, fy=scale,
+                         interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise RuntimeError('图片编码失败')
+    return buffer.tobytes()
+
+
+class AnnotatedImageStore:
+    """标注图片的内存缓存
+
+    检测接口可以只返回一个短期有效的URL，客户端需要时再单独下载图片，
+    避免把整张图片以base64形式塞进JSON。超过容量或过期的图片会被淘汰。
+    """
+
+    def __init__(self, max_items: int = 256, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_items: 最多缓存的图片数
+            ttl_seconds: 图片的有效期（秒）
+        """
+        self.max_items = max(1, int(max_items))
+        self.ttl = float(ttl_seconds)
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, owner=None) -> str:
+        """
+        保存一张图片
+
+        Args:
+            data: JPEG字节串
+            owner: 图片所属的用户ID，读取时校验
+
+        Returns:
+            图片的随机标识
+        """
+        key = secrets.token_urlsafe(16)
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, owner, data)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return key
+
+    def get(self, key: str, owner=None) -> Optional[bytes]:
+        """读取图片，不存在、已过期或不属于owner时返回None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, item_owner, data = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+        if item_owner is not None and item_owner != owner:
+            return None
+        return data
+
+
+def dhash(img, hash_size: int = 8) -> int:
+    """
+    计算图片的差异哈希（dHash）
+
+    缩放到 (hash_size+1) x hash_size 的灰度图后比较相邻像素的明暗，
+    对压缩噪声、轻微亮度变化不敏感，几乎相同的画面会得到相同或相近的哈希。
+
+    Returns:
+        hash_size*hash_size 位的整数
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (hash_size + 1, hash_size),
+                       interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class DetectionResultCache:
+    """基于感知哈希的检测结果缓存
+
+    取餐终端在学生加菜期间会反复提交几乎相同的画面，按图片的dHash（加模型版本）
+    缓存检测结果，命中时直接跳过YOLO推理。按LRU淘汰，并且每条结果有有效期。
+
+    标注图片以JPEG保存，命中时再解码，总大小受 max_bytes 限制。
+    允许近似匹配时，哈希按鸽巢原理分成 max_distance+1 段建立索引：汉明距离不超过
+    max_distance 的两个哈希至少有一段完全相同，因此只需比较共享某一段的条目。
+    """
+
+    # 每条缓存除标注图片外的大致开销（字节）
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self,
+                 max_items: int = 512,
+                 ttl_seconds: float = 60.0,
+                 max_distance: int = 0,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 jpeg_quality: int = 90,
+                 hash_bits: int = 64):
+        """
+        Args:
+            max_items: 最多缓存的结果数
+            ttl_seconds: 结果的有效期（秒）
+            max_distance: 视为同一画面的最大哈希汉明距离，0表示只接受完全相同的哈希；
+                64位dHash下即使很小的距离也可能匹配到加了一道菜的画面
+            max_bytes: 缓存总大小上限（字节）
+            jpeg_quality: 缓存标注图片时的JPEG质量
+            hash_bits: 感知哈希的位数
+        """
+        self.max_items = max(1, int(max_items))
+        self.ttl = float(ttl_seconds)
+        self.max_distance = max(0, int(max_distance))
+        self.max_bytes = max(1, int(max_bytes))
+        self.jpeg_quality = int(jpeg_quality)
+        self._items = OrderedDict()  # key -> (过期时间, 结果, 大小)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # 近似匹配的分段索引：(模型版本, 段序号, 段的值) -> 条目key集合
+        parts = self.max_distance + 1
+        bounds = [hash_bits * k // parts for k in range(parts + 1)]
+        self._segments = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])
+                          if hi > lo]
+        self._index = {}
+
+    def _segment_keys(self, key):
+        phash, version = key
+        return [(version, k, (phash >> shift) & mask)
+                for k, (shift, mask) in enumerate(self._segments)]
+
+    def _find(self, key):
+        """查找完全匹配的条目，找不到时在共享某一段哈希的条目中按汉明距离查找"""
+        if key in self._items:
+            return key
+        if not self.max_distance:
+            return None
+        phash = key[0]
+        best, best_distance = None, self.max_distance + 1
+        for segment in self._segment_keys(key):
+            for other in self._index.get(segment, ()):
+                distance = bin(other[0] ^ phash).count('1')
+                if distance < best_distance:
+                    best, best_distance = other, distance
+        return best
+
+    def _remove(self, key):
+        """删除条目及其索引（调用方持有锁）"""
+        _, _, size = self._items.pop(key)
+        self._bytes -= size
+        if self.max_distance:
+            for segment in self._segment_keys(key):
+                keys = self._index.get(segment)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._index[segment]
+
+    def get(self, phash: int, model_version: str,
+            need_render: bool = False) -> Optional[dict]:
+        """
+        查找缓存的检测结果
+
+        Args:
+            phash: 图片的感知哈希
+            model_version: 模型版本，模型更新后旧结果自动失效
+            need_render: 调用方是否需要标注图片，缓存中没有时视为未命中
+
+        Returns:
+            检测结果（与 predict_batch 的单项格式相同），未命中时为None
+        """
+        now = time.monotonic()
+        with self._lock:
+            key = self._find((phash, model_version))
+            output = None
+            if key is not None:
+                expires_at, cached, _ = self._items[key]
+                if expires_at < now:
+                    self._remove(key)
+                elif not need_render or cached['annotated_jpeg'] is not None:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    output = cached
+            if output is None:
+                self.misses += 1
+                return None
+
+        # 在锁外解码标注图片
+        result = {k: v for k, v in output.items() if k != 'annotated_jpeg'}
+        result['annotated'] = None
+        if need_render and output['annotated_jpeg'] is not None:
+            result['annotated'] = cv2.imdecode(
+                np.frombuffer(output['annotated_jpeg'], dtype=np.uint8), cv2.IMREAD_COLOR)
+        return result
+
+    def put(self, phash: int, model_version: str, output: dict):
+        """保存一条检测结果（标注图片编码为JPEG后保存）"""
+        annotated = output.get('annotated')
+        jpeg = encode_jpeg(annotated, self.jpeg_quality) if annotated is not None else None
+        cached = {k: v for k, v in output.items() if k not in ('annotated', 'timings')}
+        cached['annotated_jpeg'] = jpeg
+        size = self.ENTRY_OVERHEAD * (1 + len(cached.get('detections') or ())) + \
+            (len(jpeg) if jpeg else 0)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            key = (phash, model_version)
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (time.monotonic() + self.ttl, cached, size)
+            self._bytes += size
+            if self.max_distance:
+                for segment in self._segment_keys(key):
+                    self._index.setdefault(segment, set()).add(key)
+            while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._index.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_items': self.max_items,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class _PendingRequest:
+    """等待合批的单张图片请求"""
+
+    __slots__ = ('image', 'render', 'future')
+
+    def __init__(self, image, render: bool = True):
+        self.image = image
+        self.render = render
+        self.future = Future()
+
+
+class BatchInferenceQueue:
+    """微批处理推理队列
+
+    请求线程调用 infer() 提交图片后阻塞等待；后台线程在 max_wait_ms 时间窗口内
+    收集最多 max_batch_size 张图片，一次性送入模型，再把结果分发给各个调用方。
+    """
+
+    def __init__(self,
+                 predict_fn: Callable[[list, List[bool]], list],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0,
+                 num_dispatchers: int = 1):
+        """
+        Args:
+            predict_fn: 批量推理函数，输入图片列表和对应的是否绘制标注标志，返回等长的结果列表
+            max_batch_size: 单个批次的最大图片数
+            max_wait_ms: 收到第一张图片后等待凑批的最长时间（毫秒）
+            num_dispatchers: 同时在执行的批次数上限（使用进程池时设为工作进程数）
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.num_dispatchers = max(1, int(num_dispatchers))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._workers = []
+        # 已执行的批次数和图片数，用于统计平均批大小
+        self.batches = 0
+        self.images = 0
+
+    def _ensure_worker(self):
+        """按需启动后台合批线程"""
+        if len(self._workers) == self.num_dispatchers and \
+                all(t.is_alive() for t in self._workers):
+            return
+        with self._lock:
+            self._workers = [t for t in self._workers if t.is_alive()]
+            while len(self._workers) < self.num_dispatchers:
+                worker = threading.Thread(
+                    target=self._run,
+                    name=f'yolo-batcher-{len(self._workers)}',
+                    daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, image, render: bool = True) -> Future:
+        """
+        提交一张图片，立即返回Future
+
+        Args:
+            image: BGR图片
+            render: 是否需要绘制标注图片
+
+        Returns:
+            Future，完成后结果为 predict_fn 对该图片的输出
+        """
+        self._ensure_worker()
+        pending = _PendingRequest(image, render)
+        self._queue.put(pending)
+        return pending.future
+
+    def depth(self) -> int:
+        """等待凑批的图片数"""
+        return self._queue.qsize()
+
+    def infer(self, image, render: bool = True,
+              timeout: Optional[float] = None):
+        """提交一张图片并阻塞等待结果"""
+        return self.submit(image, render).result(timeout=timeout)
+
+    def infer_many(self, images: list, render: bool = True,
+                   timeout: Optional[float] = None) -> list:
+        """提交多张图片（可与其他请求的图片合并成同一批次）并等待全部结果"""
+        futures = [self.submit(image, render) for image in images]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def _collect_batch(self) -> List[_PendingRequest]:
+        """阻塞直到拿到第一张图片，然后在时间窗口内继续凑批"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # 同一时刻只允许一个线程凑批，避免多个线程把同一窗口内的请求拆散
+            with self._collect_lock:
+                batch = self._collect_batch()
+            # 跳过已被调用方取消的请求
+            batch = [p for p in batch if p.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self._lock:
+                self.batches += 1
+                self.images += len(batch)
+            try:
+                outputs = self.predict_fn([p.image for p in batch],
+                                          [p.render for p in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError('批量推理返回的结果数量与输入不一致')
+            except Exception as e:
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+            for p, output in zip(batch, outputs):
+                p.future.set_result(output)
+
+
+# ==================== 推理工作进程池 ====================
+
+# 每个工作进程各自持有的模型副本
+_worker_model = None
+
+
+def _init_worker(model_path: str, imgsz: int,
+                 threads_per_worker: int, counter):
+    """
+    工作进程初始化：限制线程数、绑定CPU核心并加载、预热模型
+
+    Args:
+        model_path: .pt 权重或父进程已导出的模型路径，工作进程不再导出
+        imgsz: 输入尺寸
+        threads_per_worker: 每个进程允许torch使用的线程数
+        counter: 进程间共享的计数器，用于给工作进程分配序号
+    """
+    global _worker_model
+
+    # 必须在导入torch之前设置，避免每个进程都按全部核心数开线程
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads_per_worker)
+
+    with counter.get_lock():
+        worker_index = counter.value
+        counter.value += 1
+
+    # 按序号把进程绑定到互不重叠的CPU核心上（仅Linux支持）
+    if hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (worker_index * threads_per_worker) % len(cpus)
+        pinned = {cpus[(start + k) % len(cpus)]
+                  for k in range(min(threads_per_worker, len(cpus)))}
+        try:
+            os.sched_setaffinity(0, pinned)
+        except OSError:
+            pass
+
+    import torch
+
+    cv2.setNumThreads(1)
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    _worker_model = _load_yolo(model_path, imgsz, warmup=True)
+
+
+def _worker_ping() -> int:
+    """空任务，用于让进程池提前启动工作进程"""
+    return os.getpid()
+
+
+def _worker_predict(images: list, render: List[bool] = None) -> List[dict]:
+    """在工作进程中执行批量推理"""
+    return predict_batch(_worker_model, images, render)
+
+
+class InferenceWorkerPool:
+    """推理工作进程池
+
+    启动 num_workers 个独立进程，每个进程持有一份模型副本并限制自身线程数，
+    使推理能随CPU核心数线性扩展，而不是在Flask线程之间争抢GIL和torch线程。
+    """
+
+    def __init__(self,
+                 weights_path: str,
+                 num_workers: int = 2,
+                 threads_per_worker: Optional[int] = None,
+                 runtime: str = 'torch',
+                 imgsz: int = 640):
+        """
+        Args:
+            weights_path: 模型权重路径
+            num_workers: 工作进程数
+            threads_per_worker: 每个进程的torch线程数，默认按CPU核心数平均分配
+            runtime: 推理运行时，见 SUPPORTED_RUNTIMES
+            imgsz: 输入尺寸
+        """
+        if runtime not in SUPPORTED_RUNTIMES:
+            raise ValueError(f'不支持的推理运行时: {runtime}')
+        self.runtime = runtime
+        self.num_workers = max(1, int(num_workers))
+        if not threads_per_worker:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.threads_per_worker = int(threads_per_worker)
+
+        # 在父进程中导出一次，工作进程直接加载导出结果，避免多个进程同时导出同一个文件
+        self.model_path = weights_path
+        if runtime != 'torch':
+            self.model_path = export_model(weights_path, runtime, imgsz)
+
+        # 使用spawn避免fork时把父进程中的线程和锁状态带入子进程
+        ctx = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.model_path, imgsz,
+                      self.threads_per_worker, ctx.Value('i', 0))
+        )
+
+    def preload(self):
+        """提前启动全部工作进程（各自完成模型加载和预热），不等待完成"""
+        for _ in range(self.num_workers):
+            self._executor.submit(_worker_ping)
+
+    def submit(self, images: list, render: List[bool] = None) -> Future:
+        """提交一批图片，返回Future"""
+        return self._executor.submit(_worker_predict, images, render)
+
+    def predict(self, images: list, render: List[bool] = None) -> List[dict]:
+        """提交一批图片并阻塞等待结果"""
+        return self.submit(images, render).result()
+
+    def shutdown(self, wait: bool = True):
+        """关闭进程池"""
+        self._executor.shutdown(wait=wait)
@@ -1,8 +1,9 @@
 """
 MySQL 数据库初始化脚本
-使用前请先在MySQL中创建数据库
+使用前请先在MySQL中创建数据库；升级部署后也需要运行一次，为新增的汇总表按已有数据建立初始统计
 """
-from app import app, db, User
+from app import app, db, User, refresh_dish_summaries
+from rollup_stats import bootstrap_rollups
 from werkzeug.security import generate_password_hash
 
 
@@ -40,6 +41,19 @@ def init_database():
         else:
             print("ℹ️ 管理员账号已存在")
 
+    # 菜品营养汇总表按当前营养数据同步一次，之后由服务进程的后台线程保持同步
+    with app.app_context():
+        refresh_dish_summaries(force=True)
+    print("✅ 菜品营养汇总表已同步")
+
+    # 汇总表刚创建（或从未重建过）时按原始数据统计一次，之后随写入增量更新
+    rebuilt = bootstrap_rollups()
+    if rebuilt:
+        print("✅ 每日统计汇总已按已有数据重建: " +
+              "，".join(f"{metric} {count} 行" for metric, count in sorted(rebuilt.items())))
+    else:
+        print("ℹ️ 每日统计汇总已存在")
+
     print("🎉 数据库初始化完成！")
 
 
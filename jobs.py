@@ -0,0 +1,200 @@
+"""
+后台任务队列
+检测请求可以只提交任务并立即返回任务ID，由后台线程执行完整的检测流程，
+客户端通过轮询或服务器推送事件（SSE）获取结果
+"""
+import asyncio
+import json
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+# 服务器推送事件连接的保活注释行
+SSE_KEEPALIVE = ': keepalive\n\n'
+
+
+class QueueFullError(Exception):
+    """等待执行的任务过多"""
+
+
+class Job:
+    """一个后台任务"""
+
+    def __init__(self, owner=None):
+        self.id = secrets.token_urlsafe(12)
+        self.owner = owner
+        self.status = 'queued'  # queued / running / done / failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._watchers = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def to_dict(self) -> dict:
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+    def to_event(self):
+        """
+        当前状态的服务器推送事件
+
+        Returns:
+            tuple: (text/event-stream 格式的事件文本, 状态)
+        """
+        data = self.to_dict()
+        text = f"event: {data['status']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        return text, data['status']
+
+
+class JobQueue:
+    """进程内的后台任务队列
+
+    任务由固定数量的线程执行；结束的任务保留 ttl_seconds 秒供客户端取回结果。
+    """
+
+    def __init__(self, workers: int = 4, ttl_seconds: float = 600.0,
+                 max_pending: int = 1000):
+        """
+        Args:
+            workers: 执行任务的线程数
+            ttl_seconds: 任务结束后结果的保留时间（秒）
+            max_pending: 最多允许排队（尚未结束）的任务数
+        """
+        self.ttl = ttl_seconds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='detect-job')
+        self._jobs = {}
+        self._pending = 0
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def _expire(self, now: float):
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.finished and now - j.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    def submit(self, fn: Callable[[], object], owner=None) -> Job:
+        """
+        提交任务
+
+        Args:
+            fn: 无参数的可调用对象，返回值即任务结果
+            owner: 任务所属的用户ID，查询时校验
+
+        Returns:
+            Job
+
+        Raises:
+            QueueFullError: 排队的任务过多
+        """
+        job = Job(owner)
+        with self._cond:
+            self._expire(time.time())
+            if self._pending >= self.max_pending:
+                raise QueueFullError('检测任务过多，请稍后重试')
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _notify(self, job: Job):
+        """唤醒同步和异步的等待者（需持有锁）"""
+        self._cond.notify_all()
+        watchers, job._watchers = job._watchers, []
+        for notify in watchers:
+            notify()
+
+    def _run(self, job: Job, fn: Callable[[], object]):
+        with self._cond:
+            job.status = 'running'
+            self._running += 1
+            self._notify(job)
+        try:
+            result, error, status = fn(), None, 'done'
+        except Exception as e:
+            result, error, status = None, str(e), 'failed'
+        with self._cond:
+            job.result, job.error, job.status = result, error, status
+            job.finished_at = time.time()
+            self._running -= 1
+            self._pending -= 1
+            self._notify(job)
+
+    def get(self, job_id: str, owner=None) -> Optional[Job]:
+        """查询任务，不存在或不属于owner时返回None"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None or (job.owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def wait(self, job: Job, last_status: str = None,
+             timeout: float = 15.0) -> str:
+        """
+        等待任务状态发生变化
+
+        Args:
+            job: 任务
+            last_status: 调用方已知的状态
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            任务当前状态（超时时可能与last_status相同）
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: job.status != last_status,
+                                timeout=timeout)
+            return job.status
+
+    async def wait_async(self, job: Job, last_status: str = None,
+                         timeout: float = 15.0) -> str:
+        """
+        wait() 的协程版本，等待期间不占用线程，供ASGI服务使用
+
+        Args:
+            job: 任务
+            last_status: 调用方已知的状态
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            任务当前状态（超时时可能与last_status相同）
+        """
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(
+                lambda: changed.done() or changed.set_result(None))
+
+        with self._cond:
+            if job.status != last_status:
+                return job.status
+            job._watchers.append(notify)
+        try:
+            await asyncio.wait_for(changed, timeout)
+        except asyncio.TimeoutError:
+            with self._cond:
+                if notify in job._watchers:
+                    job._watchers.remove(notify)
+        return job.status
+
+    def stats(self) -> dict:
+        """排队和执行中的任务数"""
+        with self._cond:
+            return {
+                'queued': self._pending - self._running,
+                'running': self._running,
+                'retained': len(self._jobs)
+            }
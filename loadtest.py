@@ -0,0 +1,489 @@
+"""
+取餐线压力测试
+模拟大量取餐终端（虚拟用户）同时工作：每个虚拟用户登录后循环提交合成的餐盘图片和
+WeightSensorSimulator.simulate_with_anomalies 生成的重量数据，按加压曲线增减并发数，
+统计各接口的 p50/p95/p99 延迟、吞吐量和错误率，并给出满足延迟目标时能支撑的最大并发取餐线数。
+
+只使用标准库发送请求，每个虚拟用户一个线程、一条保持连接的HTTP连接。
+
+用法:
+    # 终端1：用SQLite（或 --database 指向本地MySQL）启动被测服务
+    python loadtest.py serve --database sqlite:///loadtest.db --port 5000
+
+    # 终端2：200个虚拟用户，60秒内线性加压后保持120秒
+    python loadtest.py run --url http://127.0.0.1:5000 --users 200 --profile ramp
+    # 自定义阶段（持续秒数:目标并发数）
+    python loadtest.py run --stages 30:50,60:50,30:200,60:200,20:0 --output report.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+# 菜品颜色（BGR），合成餐盘时随机选用
+DISH_COLORS = ((40, 70, 160), (230, 230, 230), (60, 180, 230), (50, 140, 60),
+               (30, 90, 200), (120, 160, 200), (20, 40, 90), (90, 200, 120))
+ANOMALY_TYPES = ('none', 'missing', 'extra', 'merged')
+
+
+def profile_stages(profile: str, users: int, ramp: float, hold: float) -> List[Tuple[float, int]]:
+    """
+    内置加压曲线
+
+    Args:
+        profile: smoke（少量用户冒烟）、ramp（线性加压后保持）、step（分四级阶梯加压）、
+                 spike（保持一半并发时突增到全部并发）
+        users: 最大并发数
+        ramp: 加压时长（秒）
+        hold: 保持时长（秒）
+
+    Returns:
+        [(持续秒数, 阶段结束时的目标并发数)]，阶段内并发数线性变化
+    """
+    if profile == 'smoke':
+        return [(5, min(users, 5)), (hold, min(users, 5))]
+    if profile == 'step':
+        stages = []
+        for k in range(1, 5):
+            target = max(1, users * k // 4)
+            stages += [(ramp / 4, target), (hold / 4, target)]
+        return stages + [(10, 0)]
+    if profile == 'spike':
+        half = max(1, users // 2)
+        return [(ramp, half), (hold / 2, half), (5, users), (hold / 2, users),
+                (5, half), (hold / 2, half), (10, 0)]
+    return [(ramp, users), (hold, users), (10, 0)]
+
+
+def parse_stages(text: str) -> List[Tuple[float, int]]:
+    """解析 "30:50,60:200,20:0" 格式的加压阶段"""
+    stages = []
+    for part in text.split(','):
+        duration, target = part.split(':')
+        stages.append((float(duration), int(target)))
+    return stages
+
+
+def target_users(stages: List[Tuple[float, int]], elapsed: float) -> Optional[int]:
+    """当前时刻的目标并发数，全部阶段结束后返回None"""
+    start_users = 0
+    for duration, target in stages:
+        if elapsed < duration:
+            return int(round(start_users + (target - start_users) * elapsed / duration))
+        elapsed -= duration
+        start_users = target
+    return None
+
+
+def synthetic_trays(count: int, seed: int = 0, width: int = 640, height: int = 480):
+    """
+    生成合成餐盘：灰色托盘上从左到右排列2~6个椭圆形菜品，以及每个菜品的真实重量
+
+    Returns:
+        list: [(JPEG字节串, 真实重量列表)]
+    """
+    rng = np.random.RandomState(seed)
+    trays = []
+    for _ in range(count):
+        img = np.full((height, width, 3), 180, dtype=np.uint8)
+        cv2.rectangle(img, (20, 20), (width - 20, height - 20), (150, 150, 150), -1)
+        n = rng.randint(2, 7)
+        slot = (width - 60) / n
+        weights = []
+        for i in range(n):
+            cx = int(40 + slot * (i + 0.5))
+            cy = int(rng.uniform(height * 0.3, height * 0.7))
+            axes = (int(slot * rng.uniform(0.3, 0.45)), int(rng.uniform(40, 110)))
+            color = DISH_COLORS[rng.randint(len(DISH_COLORS))]
+            cv2.ellipse(img, (cx, cy), axes, 0, 0, 360, color, -1)
+            weights.append(float(rng.uniform(40, 220)))
+        noise = rng.normal(0, 6, img.shape)
+        img = np.clip(img + noise, 0, 255).astype(np.uint8)
+        ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        trays.append((buffer.tobytes(), weights))
+    return trays
+
+
+def weight_streams_for(trays, seed: int = 0) -> List[List[dict]]:
+    """为每个餐盘生成一条带随机异常（漏检、误检、合并）的重量事件序列"""
+    from weight_alignment import WeightSensorSimulator, events_to_json
+
+    rng = random.Random(seed)
+    simulator = WeightSensorSimulator(noise_level=1.0, seed=seed)
+    streams = []
+    for _, weights in trays:
+        anomaly = rng.choice(ANOMALY_TYPES)
+        events = (simulator.simulate_weight_sequence(weights) if anomaly == 'none'
+                  else simulator.simulate_with_anomalies(weights, anomaly))
+        streams.append(events_to_json(events))
+    return streams
+
+
+def stream_samples(events: List[dict], rate_hz: float = 10.0) -> List[List[float]]:
+    """把重量事件展开为电子秤的连续读数 [[时间戳, 重量], ...]（每个台阶保持0.5秒）"""
+    samples = []
+    base = time.time()
+    for event in events:
+        for k in range(int(0.5 * rate_hz)):
+            samples.append([base + event['timestamp'] + k / rate_hz,
+                            event['cumulative_weight']])
+    return samples
+
+
+def _multipart(fields: Dict[str, str], files: Dict[str, Tuple[str, bytes]]):
+    """构造 multipart/form-data 请求体"""
+    boundary = secrets.token_hex(16)
+    chunks = []
+    for name, value in fields.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                      f'{value}\r\n'.encode('utf-8'))
+    for name, (filename, data) in files.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                      f'filename="{filename}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode('utf-8'))
+        chunks.append(data + b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(chunks), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """线程安全的请求结果记录"""
+
+    def __init__(self):
+        self.samples = []  # (结束时间, 接口, 耗时秒, 是否成功)
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, started: float, ok: bool, error: str = None):
+        now = time.monotonic()
+        with self._lock:
+            self.samples.append((now, name, now - started, ok))
+            if error:
+                key = f'{name}: {error}'
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def since(self, start: int) -> list:
+        with self._lock:
+            return self.samples[start:]
+
+
+class VirtualUser(threading.Thread):
+    """一条取餐线：登录后循环提交餐盘，直到控制器把并发数降到自己的序号以下"""
+
+    def __init__(self, index: int, runner: 'LoadRunner'):
+        super().__init__(name=f'vu-{index}', daemon=True)
+        self.index = index
+        self.runner = runner
+        self.username = f'{runner.user_prefix}{index}'
+        self.cookie = None
+        self.conn = None
+        self.rng = random.Random(runner.seed * 100003 + index)
+
+    def _request(self, name: str, method: str, path: str, body: bytes = None,
+                 content_type: str = None, expected=()) -> Tuple[int, bytes]:
+        """发送请求并记录耗时，连接断开时重连一次；expected 中的状态码也视为成功"""
+        headers = {'Connection': 'keep-alive'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        started = time.monotonic()
+        for attempt in (0, 1):
+            try:
+                if self.conn is None:
+                    self.conn = self.runner.connect()
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                if attempt:
+                    self.runner.recorder.record(name, started, False, type(e).__name__)
+                    return 0, b''
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        ok = 200 <= response.status < 300 or response.status in expected
+        self.runner.recorder.record(name, started, ok, None if ok else f'HTTP {response.status}')
+        return response.status, data
+
+    def _post_json(self, name: str, path: str, payload: dict, expected=()) -> int:
+        status, _ = self._request(name, 'POST', path, json.dumps(payload).encode('utf-8'),
+                                  'application/json', expected)
+        return status
+
+    def login(self) -> bool:
+        credentials = {'username': self.username, 'password': self.runner.password}
+        # 允许自动注册时，第一次登录返回401（用户不存在）是预期的
+        status = self._post_json('login', '/login', credentials,
+                                 expected=(401,) if self.runner.register else ())
+        if status == 401 and self.runner.register:
+            self._post_json('register', '/register', dict(
+                credentials, height=170, weight=65, age=22, gender='男', health_goal='维持'))
+            status = self._post_json('login', '/login', credentials)
+        return status == 200
+
+    def run_tray(self):
+        runner = self.runner
+        k = self.rng.randrange(len(runner.trays))
+        image, _ = runner.trays[k]
+        events = runner.streams[k]
+        fields = {'image_mode': runner.image_mode}
+        if runner.weight_mode == 'stream':
+            scale_id = f'lane-{self.index}'
+            self._post_json('weight_stream', f'/weight_stream/{scale_id}',
+                            {'samples': stream_samples(events), 'reset': True})
+            fields['scale_id'] = scale_id
+        else:
+            fields['weight_data'] = json.dumps(events)
+        body, content_type = _multipart(fields, {'image': ('tray.jpg', image)})
+        self._request('detect', 'POST', '/detect', body, content_type)
+
+    def run(self):
+        runner = self.runner
+        try:
+            if not self.login():
+                return
+            # 错开各取餐线的第一次提交
+            time.sleep(self.rng.uniform(0, runner.think_time))
+            while not runner.stopped and self.index < runner.active_target:
+                self.run_tray()
+                time.sleep(max(0.0, self.rng.gauss(runner.think_time, runner.think_time * 0.25)))
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+
+class LoadRunner:
+    """按加压阶段启动和停止虚拟用户，并定期输出实时统计"""
+
+    def __init__(self, url: str, stages, trays, streams, think_time: float = 2.0,
+                 image_mode: str = 'none', weight_mode: str = 'events',
+                 user_prefix: str = 'loadtest_', password: str = 'loadtest',
+                 register: bool = True, timeout: float = 60.0, seed: int = 0,
+                 report_interval: float = 10.0):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or 'http'
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or (443 if self.scheme == 'https' else 80)
+        self.stages = stages
+        self.trays = trays
+        self.streams = streams
+        self.think_time = think_time
+        self.image_mode = image_mode
+        self.weight_mode = weight_mode
+        self.user_prefix = user_prefix
+        self.password = password
+        self.register = register
+        self.timeout = timeout
+        self.seed = seed
+        self.report_interval = report_interval
+        self.recorder = Recorder()
+        self.active_target = 0
+        self.stopped = False
+        self.users: Dict[int, VirtualUser] = {}
+        self.timeline = []
+
+    def connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _interval_stats(self, samples, seconds: float, users: int) -> dict:
+        detect = [s for s in samples if s[1] == 'detect']
+        latencies = np.array([s[2] for s in detect if s[3]]) * 1000
+        return {
+            'users': users,
+            'detect_rps': round(len(detect) / seconds, 2) if seconds else 0.0,
+            'errors': sum(1 for s in samples if not s[3]),
+            'error_rate': round(sum(1 for s in detect if not s[3]) / len(detect), 4) if detect else 0.0,
+            'p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+            'p95_ms': round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        }
+
+    def run(self) -> dict:
+        started = time.monotonic()
+        last_report, last_sample = started, 0
+        print(f"{'时间s':>6}{'并发':>8}{'检测/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'错误':>8}")
+        try:
+            while True:
+                now = time.monotonic()
+                target = target_users(self.stages, now - started)
+                if target is None:
+                    break
+                # 降压时序号不小于目标数的虚拟用户在完成当前餐盘后退出
+                self.active_target = target
+                for index in range(target):
+                    user = self.users.get(index)
+                    if user is None or not user.is_alive():
+                        user = self.users[index] = VirtualUser(index, self)
+                        user.start()
+                if now - last_report >= self.report_interval:
+                    samples = self.recorder.since(last_sample)
+                    last_sample += len(samples)
+                    stats = self._interval_stats(samples, now - last_report, target)
+                    stats['elapsed'] = round(now - started, 1)
+                    self.timeline.append(stats)
+                    print(f"{stats['elapsed']:>6.0f}{target:>8}{stats['detect_rps']:>10.2f}"
+                          f"{stats['p50_ms'] or 0:>10.1f}{stats['p95_ms'] or 0:>10.1f}"
+                          f"{stats['errors']:>8}")
+                    last_report = now
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            print("中断，正在停止虚拟用户...")
+        finally:
+            self.stopped = True
+            self.active_target = 0
+        deadline = time.monotonic() + self.timeout
+        for user in self.users.values():
+            user.join(max(0.0, deadline - time.monotonic()))
+        return self.report(time.monotonic() - started)
+
+    def report(self, duration: float) -> dict:
+        """汇总各接口的延迟分位数、吞吐量和错误率"""
+        samples = self.recorder.since(0)
+        endpoints = {}
+        for name in sorted({s[1] for s in samples}):
+            rows = [s for s in samples if s[1] == name]
+            latencies = np.array([s[2] for s in rows if s[3]]) * 1000
+            entry = {
+                'requests': len(rows),
+                'errors': sum(1 for s in rows if not s[3]),
+                'throughput_rps': round(len(rows) / duration, 2) if duration else 0.0
+            }
+            if len(latencies):
+                entry.update({
+                    'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+                    'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+                    'p99_ms': round(float(np.percentile(latencies, 99)), 1),
+                    'max_ms': round(float(latencies.max()), 1),
+                    'mean_ms': round(float(latencies.mean()), 1)
+                })
+            endpoints[name] = entry
+        return {
+            'duration_seconds': round(duration, 1),
+            'stages': self.stages,
+            'endpoints': endpoints,
+            'errors': dict(sorted(self.recorder.errors.items(), key=lambda kv: -kv[1])[:20]),
+            'timeline': self.timeline
+        }
+
+
+def sustained_lanes(timeline: List[dict], slo_ms: float, max_error_rate: float = 0.01) -> int:
+    """检测接口p95不超过slo_ms且错误率不超过max_error_rate的统计区间中的最大并发数"""
+    passing = [t['users'] for t in timeline
+               if t['p95_ms'] is not None and t['p95_ms'] <= slo_ms
+               and t['error_rate'] <= max_error_rate]
+    return max(passing, default=0)
+
+
+def print_report(report: dict, slo_ms: float):
+    print(f"\n持续 {report['duration_seconds']} 秒")
+    print(f"{'接口':<14}{'请求数':>8}{'错误':>8}{'吞吐/秒':>10}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'最大ms':>10}")
+    for name, e in report['endpoints'].items():
+        print(f"{name:<16}{e['requests']:>8}{e['errors']:>8}{e['throughput_rps']:>10.2f}"
+              f"{e.get('p50_ms', 0):>10.1f}{e.get('p95_ms', 0):>10.1f}"
+              f"{e.get('p99_ms', 0):>10.1f}{e.get('max_ms', 0):>10.1f}")
+    if report['errors']:
+        print("\n主要错误:")
+        for error, count in report['errors'].items():
+            print(f"  {error}: {count}")
+    print(f"\n检测 p95 ≤ {slo_ms:.0f}ms 且错误率 ≤ 1% 时的最大并发取餐线数: "
+          f"{report['sustained_lanes']}")
+
+
+def serve(args):
+    """用指定的数据库启动被测服务（多线程Flask开发服务器）"""
+    os.environ['DATABASE_URL'] = args.database
+    from app import app
+    from benchmark import prepare_database
+
+    with app.app_context():
+        prepare_database()
+    print(f"数据库: {args.database}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+def run(args):
+    stages = parse_stages(args.stages) if args.stages else profile_stages(
+        args.profile, args.users, args.ramp, args.hold)
+    print(f"准备 {args.trays} 个合成餐盘...")
+    trays = synthetic_trays(args.trays, seed=args.seed)
+    streams = weight_streams_for(trays, seed=args.seed)
+
+    runner = LoadRunner(
+        args.url, stages, trays, streams,
+        think_time=args.think_time, image_mode=args.image_mode,
+        weight_mode=args.weight_mode, user_prefix=args.user_prefix,
+        register=not args.no_register, timeout=args.timeout, seed=args.seed,
+        report_interval=args.report_interval)
+    report = runner.run()
+    report['sustained_lanes'] = sustained_lanes(report['timeline'], args.slo_ms)
+    report['settings'] = {k: v for k, v in vars(args).items() if k != 'func'}
+    print_report(report, args.slo_ms)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到 {args.output}")
+    failed = sum(e['errors'] for e in report['endpoints'].values())
+    total = sum(e['requests'] for e in report['endpoints'].values())
+    if total and failed / total > args.max_error_rate:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='取餐线压力测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('serve', help='用SQLite或本地MySQL启动被测服务')
+    p.add_argument('--database', default='sqlite:///loadtest.db', help='数据库URL')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=5000)
+    p.set_defaults(func=serve)
+
+    p = subparsers.add_parser('run', help='运行压力测试')
+    p.add_argument('--url', default='http://127.0.0.1:5000', help='被测服务地址')
+    p.add_argument('--users', type=int, default=100, help='最大并发虚拟用户（取餐线）数')
+    p.add_argument('--profile', choices=('smoke', 'ramp', 'step', 'spike'), default='ramp',
+                   help='内置加压曲线')
+    p.add_argument('--ramp', type=float, default=60, help='加压时长（秒）')
+    p.add_argument('--hold', type=float, default=120, help='保持时长（秒）')
+    p.add_argument('--stages', default=None,
+                   help='自定义加压阶段 "持续秒数:目标并发数,..."，指定时忽略 --profile')
+    p.add_argument('--think-time', type=float, default=3.0,
+                   help='每条取餐线两次提交之间的平均间隔（秒）')
+    p.add_argument('--image-mode', choices=('none', 'url', 'inline'), default='none',
+                   help='/detect 的标注图片返回方式')
+    p.add_argument('--weight-mode', choices=('events', 'stream'), default='events',
+                   help='events: 随 /detect 提交重量事件；stream: 先通过 /weight_stream 上传秤读数')
+    p.add_argument('--trays', type=int, default=200, help='合成餐盘的数量')
+    p.add_argument('--user-prefix', default='loadtest_', help='虚拟用户的用户名前缀')
+    p.add_argument('--no-register', action='store_true', help='登录失败时不自动注册')
+    p.add_argument('--timeout', type=float, default=60.0, help='单个请求的超时（秒）')
+    p.add_argument('--slo-ms', type=float, default=1000.0, help='检测接口的p95延迟目标（毫秒）')
+    p.add_argument('--max-error-rate', type=float, default=0.01,
+                   help='总错误率超过该值时以非零状态退出')
+    p.add_argument('--report-interval', type=float, default=10.0, help='实时统计的间隔（秒）')
+    p.add_argument('--seed', type=int, default=0, help='随机种子')
+    p.add_argument('--output', default=None, help='把报告保存为JSON')
+    p.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
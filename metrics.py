@@ -0,0 +1,216 @@
+"""
+性能指标
+检测流程各阶段的耗时直方图、HTTP请求耗时，以及队列深度、缓存命中率等在抓取时读取的指标，
+以 Prometheus 文本格式（text/plain; version=0.0.4）输出，不依赖 prometheus_client。
+
+stage() 在记录直方图的同时把耗时累加到当前请求（begin_request() 开始收集），
+用于生成 Server-Timing 响应头。
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 当前请求各阶段的累计耗时（秒），未开始收集时为None
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """带标签的直方图"""
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签值 → [各分桶计数..., 总和]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        """记录一个观测值"""
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(self.labelnames, labelvalues, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    直方图由调用方在事件发生时记录；计数器和仪表盘类指标通过回调在抓取时读取，
+    如队列深度和缓存命中次数，避免在各组件中重复维护一份计数。
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        # (名称, 类型, 说明, 回调)，回调返回 [(标签字典, 值)]
+        self._callbacks: List[Tuple[str, str, str, Callable[[], Iterable]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """创建（或返回已创建的同名）直方图"""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._histograms[name]
+
+    def register_callback(self, name: str, metric_type: str, documentation: str,
+                          fn: Callable[[], Iterable[Tuple[dict, float]]]):
+        """
+        注册在抓取时读取的指标
+
+        Args:
+            name: 指标名
+            metric_type: counter 或 gauge
+            documentation: 说明
+            fn: 返回 [(标签字典, 值)] 的回调；组件未启用时可返回空列表
+        """
+        with self._lock:
+            self._callbacks.append((name, metric_type, documentation, fn))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        with self._lock:
+            histograms = list(self._histograms.values())
+            callbacks = list(self._callbacks)
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.collect())
+        for name, metric_type, documentation, fn in callbacks:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                lines.append(f'# {name} 读取失败: {_escape(e)}')
+                continue
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f'{name}{_format_labels(list(labels), list(labels.values()))} '
+                             f'{_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'detect_stage_seconds', '检测流程各阶段耗时（秒）', ('stage',))
+
+
+def record_stage(name: str, seconds: float):
+    """记录一个阶段的耗时，并累加到当前请求"""
+    stage_seconds.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """统计 with 代码块的耗时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def add_request_timings(timings: Dict[str, float]):
+    """把在其他线程中统计的阶段耗时累加到当前请求（不重复记录直方图）"""
+    current = _request_timings.get()
+    if current is None:
+        return
+    for name, seconds in timings.items():
+        current[name] = current.get(name, 0.0) + seconds
+
+
+def begin_request():
+    """开始收集当前请求的阶段耗时，返回用于 end_request() 的标记"""
+    return _request_timings.set({})
+
+
+def current_timings() -> Dict[str, float]:
+    """当前请求到目前为止各阶段的累计耗时（秒）"""
+    return dict(_request_timings.get() or {})
+
+
+def end_request(token) -> Dict[str, float]:
+    """结束收集，返回当前请求各阶段的累计耗时（秒）"""
+    timings = _request_timings.get() or {}
+    try:
+        _request_timings.reset(token)
+    except ValueError:
+        # 标记来自其他上下文（如请求开始和结束不在同一线程），直接清空
+        _request_timings.set(None)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float],
+                         total: Optional[float] = None) -> str:
+    """
+    生成 Server-Timing 响应头
+
+    Args:
+        timings: 阶段 → 耗时（秒）
+        total: 整个请求的耗时（秒）
+
+    Returns:
+        如 "decode;dur=3.1, yolo_inference;dur=41.7, total;dur=60.2"（毫秒）
+    """
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
@@ -0,0 +1,403 @@
+"""
+个性化菜品推荐
+把全部菜品的营养成分（每100g的营养矩阵）按一份的重量一次性与用户本餐剩余的营养目标比较打分，
+并用过敏原倒排索引排除含过敏食材的菜品；评分只涉及NumPy向量运算，与菜品数量基本无关。
+
+推荐结果按 用户 × 日期 × 用餐时段 × 筛选条件 缓存，用户吃完一餐或修改资料后失效。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 成人每日参考摄入量（参考中国居民膳食营养素参考摄入量），缺少身体信息时使用
+REFERENCE_INTAKE = {
+    'energy_kcal': 2000.0,
+    'protein_g': 60.0,
+    'fat_g': 60.0,
+    'carbohydrate_g': 275.0,
+    'fiber_g': 25.0,
+    'sodium_mg': 2000.0,
+    'calcium_mg': 800.0,
+    'vitamin_c_mg': 100.0
+}
+
+# 健康目标对每日能量和蛋白质目标的调整系数
+GOAL_ENERGY_FACTORS = {'减脂': 0.85, '维持': 1.0, '增肌': 1.1}
+GOAL_PROTEIN_FACTORS = {'减脂': 1.2, '维持': 1.0, '增肌': 1.4}
+
+# 用餐时段：(标识, 名称, 开始小时, 结束小时, 占全天目标的比例)
+# 小时为食堂所在时区的钟点，与每日摄入的日期划分一致
+MEAL_WINDOWS = (
+    ('breakfast', '早餐', 0, 10, 0.3),
+    ('lunch', '午餐', 10, 15, 0.4),
+    ('dinner', '晚餐', 15, 24, 0.3),
+)
+
+# 营养缺口评分中各营养素的权重（补足越多得分越高）
+GAP_WEIGHTS = {
+    'energy_kcal': 0.2,
+    'protein_g': 0.3,
+    'carbohydrate_g': 0.15,
+    'fiber_g': 0.15,
+    'calcium_mg': 0.1,
+    'vitamin_c_mg': 0.1
+}
+# 超出本餐目标时的扣分权重（按超出目标的比例）
+EXCESS_WEIGHTS = {'energy_kcal': 0.6, 'fat_g': 0.4, 'sodium_mg': 0.4}
+
+# 常见过敏原的类别词，用户填写类别时按其中的食材关键词匹配
+ALLERGEN_SYNONYMS = {
+    '海鲜': ('虾', '蟹', '贝', '蛤', '蚌', '螺', '蚝', '牡蛎', '鱿鱼', '墨鱼', '章鱼', '海带', '紫菜', '鱼'),
+    '水产': ('虾', '蟹', '贝', '鱼'),
+    '鱼': ('鱼',),
+    '虾': ('虾',),
+    '贝类': ('贝', '蛤', '蚌', '螺', '蚝', '牡蛎', '扇贝'),
+    '坚果': ('花生', '核桃', '杏仁', '腰果', '榛子', '开心果', '松子', '栗'),
+    '花生': ('花生',),
+    '鸡蛋': ('蛋',),
+    '蛋': ('蛋',),
+    '牛奶': ('奶', '乳'),
+    '乳制品': ('奶', '乳', '芝士', '奶酪'),
+    '大豆': ('豆腐', '大豆', '黄豆', '豆浆', '豆瓣', '酱油', '生抽', '老抽'),
+    '豆制品': ('豆腐', '豆干', '腐竹', '豆浆', '豆皮'),
+    '小麦': ('面', '麸', '小麦'),
+    '麸质': ('面', '麸', '小麦', '大麦'),
+    '芝麻': ('芝麻', '麻酱', '麻油'),
+}
+
+# 口味偏好对应的菜品名称或烹饪方式关键词
+TASTE_KEYWORDS = {
+    '清淡': ('蒸', '煮', '拌', '炖', '汤', '白灼'),
+    '咸鲜': ('炒', '烧', '酱', '卤'),
+    '微辣': ('辣', '椒', '麻', '川'),
+    '香辣': ('辣', '椒', '麻', '川'),
+    '酸甜': ('糖醋', '番茄', '西红柿', '茄汁', '酸甜'),
+    '酥脆': ('炸', '煎', '脆'),
+}
+
+# 填写过敏原和偏好时常用的分隔符和虚词
+_SPLIT = re.compile(r'[\s,，、;；/|]+|和|及|与|等|过敏')
+
+RECOMMEND_MODES = ('gap', 'taste', 'lowcal')
+
+
+def parse_keywords(text: Optional[str]) -> Tuple[str, ...]:
+    """
+    把用户填写的过敏原或偏好（如 "海鲜、坚果等"）拆分为关键词
+
+    Returns:
+        去重后按原顺序排列的关键词
+    """
+    words = [w.strip() for w in _SPLIT.split(text or '')]
+    return tuple(dict.fromkeys(w for w in words if w and w not in ('无', '没有')))
+
+
+def daily_targets(fields: Sequence[str], tdee: dict = None,
+                  health_goal: str = None) -> np.ndarray:
+    """
+    每日营养目标向量
+
+    Args:
+        fields: 营养字段顺序（与营养矩阵的列一致）
+        tdee: NutritionCalculator.calculate_bmr_tdee 的结果，为None时使用参考摄入量
+        health_goal: 健康目标（减脂、维持、增肌）
+
+    Returns:
+        与fields一一对应的每日目标
+    """
+    targets = dict(REFERENCE_INTAKE)
+    if tdee:
+        macros = tdee['macronutrients']
+        targets.update(energy_kcal=tdee['tdee'],
+                       protein_g=macros['protein']['grams'],
+                       fat_g=macros['fat']['grams'],
+                       carbohydrate_g=macros['carbohydrates']['grams'])
+    energy_factor = GOAL_ENERGY_FACTORS.get(health_goal, 1.0)
+    for field in ('energy_kcal', 'fat_g', 'carbohydrate_g'):
+        targets[field] *= energy_factor
+    targets['protein_g'] *= GOAL_PROTEIN_FACTORS.get(health_goal, 1.0)
+    return np.array([targets.get(f, 0.0) for f in fields], dtype=float)
+
+
+def meal_window(hour: int) -> Tuple[str, str, float]:
+    """
+    当前所在的用餐时段
+
+    Returns:
+        tuple: (时段标识, 时段名称, 本时段及之后各时段比例之和中本时段所占的份额)
+    """
+    remaining = 0.0
+    current = None
+    for key, name, start, end, share in MEAL_WINDOWS:
+        if current is None and start <= hour < end:
+            current = (key, name, share)
+        if current is not None:
+            remaining += share
+    if current is None:
+        key, name, _, _, share = MEAL_WINDOWS[-1]
+        return key, name, 1.0
+    return current[0], current[1], current[2] / remaining
+
+
+def meal_target(daily: np.ndarray, consumed: Optional[np.ndarray],
+                meal_share: float) -> np.ndarray:
+    """
+    本餐的营养目标：当天剩余目标按剩余各餐的比例分配给本餐
+
+    Args:
+        daily: 每日目标
+        consumed: 当天已摄入量，为None时视为0
+        meal_share: meal_window() 返回的本餐份额
+
+    Returns:
+        本餐目标（不小于0）
+    """
+    remaining = daily if consumed is None else daily - consumed
+    return np.maximum(remaining, 0.0) * meal_share
+
+
+class DishRecommender:
+    """菜品推荐评分
+
+    对某一时刻的营养矩阵构建后只读；营养数据变化时重新构建一个新实例替换即可。
+    过敏原索引把每个关键词映射为 [菜品数] 的布尔掩码，首次查询时计算并保留，
+    之后排除过敏菜品只需几次按位或。
+    """
+
+    def __init__(self, names: Sequence[str], cooking_methods: Sequence[str],
+                 canteen_names: Sequence[str], per_100g: np.ndarray,
+                 available: np.ndarray, ingredients: Sequence[Iterable[str]],
+                 fields: Sequence[str], portion_g: float = 150.0):
+        """
+        Args:
+            names: 菜品名称
+            cooking_methods: 烹饪方式
+            canteen_names: 所属食堂名称
+            per_100g: [n, 营养字段数] 每100g成品的营养成分
+            available: [n] 有配方（可以计算营养）的菜品
+            ingredients: 每个菜品的食材名称
+            fields: per_100g 的列顺序
+            portion_g: 按多少克计算一份菜品的营养
+        """
+        self.names = list(names)
+        self.cooking_methods = list(cooking_methods)
+        self.canteen_names = list(canteen_names)
+        self.fields = tuple(fields)
+        self.column = {f: i for i, f in enumerate(self.fields)}
+        self.per_100g = per_100g
+        self.portion_g = float(portion_g)
+        self.per_portion = per_100g * (self.portion_g / 100.0)
+        self.available = np.asarray(available, dtype=bool)
+
+        # 食材名称 → 含该食材的菜品行号
+        self._ingredient_rows: Dict[str, List[int]] = {}
+        for row, names_of_dish in enumerate(ingredients):
+            for name in names_of_dish:
+                if name:
+                    self._ingredient_rows.setdefault(name, []).append(row)
+        self._texts = [f"{n} {m or ''}" for n, m in zip(self.names, self.cooking_methods)]
+        self._term_masks: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _term_mask(self, term: str, dish_text: bool) -> np.ndarray:
+        """食材名称（dish_text为True时还包括菜品名称和烹饪方式）包含term的菜品"""
+        key = f"{int(dish_text)}:{term}"
+        mask = self._term_masks.get(key)
+        if mask is None:
+            mask = np.zeros(len(self.names), dtype=bool)
+            for name, rows in self._ingredient_rows.items():
+                if term in name:
+                    mask[rows] = True
+            if dish_text:
+                mask |= np.array([term in text for text in self._texts], dtype=bool)
+            with self._lock:
+                self._term_masks[key] = mask
+        return mask
+
+    def allergen_mask(self, allergies: Sequence[str]) -> np.ndarray:
+        """
+        含有任一过敏原的菜品
+
+        Args:
+            allergies: parse_keywords() 拆分出的过敏原关键词，类别词按 ALLERGEN_SYNONYMS 展开
+
+        Returns:
+            [n] 布尔掩码
+        """
+        mask = np.zeros(len(self.names), dtype=bool)
+        for word in allergies:
+            for term in ALLERGEN_SYNONYMS.get(word, (word,)):
+                mask |= self._term_mask(term, dish_text=True)
+        return mask
+
+    def preference_mask(self, preferences: Sequence[str]) -> np.ndarray:
+        """名称或烹饪方式符合任一口味偏好的菜品"""
+        mask = np.zeros(len(self.names), dtype=bool)
+        for word in preferences:
+            for term in TASTE_KEYWORDS.get(word, (word,)):
+                mask |= self._term_mask(term, dish_text=True)
+        return mask
+
+    def _weighted(self, weights: Dict[str, float]) -> np.ndarray:
+        vector = np.zeros(len(self.fields))
+        for field, weight in weights.items():
+            if field in self.column:
+                vector[self.column[field]] = weight
+        return vector
+
+    def score(self, target: np.ndarray, mode: str = 'gap',
+              preferences: Sequence[str] = ()) -> np.ndarray:
+        """
+        所有菜品一份的得分（0~5）
+
+        Args:
+            target: 本餐营养目标
+            mode: gap（营养缺口优先）、taste（口味偏好优先）、lowcal（低卡优选）
+            preferences: 口味偏好关键词，taste模式使用
+
+        Returns:
+            [n] 得分
+        """
+        # 每一份能补足本餐目标的比例 [n, 字段数]
+        ratio = self.per_portion / np.maximum(target, 1e-6)
+        gap = (np.minimum(ratio, 1.0) @ self._weighted(GAP_WEIGHTS)
+               - np.maximum(ratio - 1.0, 0.0) @ self._weighted(EXCESS_WEIGHTS))
+        gap = np.clip(gap / sum(GAP_WEIGHTS.values()), 0.0, 1.0)
+
+        if mode == 'lowcal':
+            energy = self.per_100g[:, self.column['energy_kcal']]
+            peak = energy[self.available].max() if self.available.any() else 0.0
+            lightness = 1.0 - energy / peak if peak > 0 else np.ones(len(energy))
+            score = 0.4 * gap + 0.6 * lightness
+        elif mode == 'taste':
+            score = 0.4 * gap + 0.6 * self.preference_mask(preferences)
+        else:
+            score = gap
+        return np.round(score * 5.0, 2)
+
+    def recommend(self, target: np.ndarray, mode: str = 'gap',
+                  allergies: Sequence[str] = (), preferences: Sequence[str] = (),
+                  cooking_method: str = None, max_kcal: float = None,
+                  limit: int = 12) -> List[dict]:
+        """
+        推荐菜品
+
+        Args:
+            target: 本餐营养目标
+            mode: 评分方式，见 score()
+            allergies: 过敏原关键词，含有的菜品被排除
+            preferences: 口味偏好关键词
+            cooking_method: 只保留该烹饪方式的菜品
+            max_kcal: 只保留每100g热量不超过该值的菜品
+            limit: 最多返回的菜品数
+
+        Returns:
+            list: 按得分从高到低排列的菜品字典
+        """
+        keep = self.available.copy()
+        if allergies:
+            keep &= ~self.allergen_mask(allergies)
+        if cooking_method:
+            keep &= np.array([m == cooking_method for m in self.cooking_methods], dtype=bool)
+        if max_kcal is not None:
+            keep &= self.per_100g[:, self.column['energy_kcal']] <= max_kcal
+
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            return []
+        scores = self.score(target, mode, preferences)[rows]
+        # 只对前limit个排序
+        if len(rows) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+
+        results = []
+        for row, score in zip(rows[order], scores[order]):
+            per_100g = self.per_100g[row]
+            portion = self.per_portion[row]
+            results.append({
+                'name': self.names[row],
+                'cooking_method': self.cooking_methods[row],
+                'canteen_name': self.canteen_names[row],
+                'score': float(score),
+                'energy_kcal_per_100g': round(float(per_100g[self.column['energy_kcal']]), 1),
+                'portion_g': self.portion_g,
+                'portion': {f: round(float(v), 1) for f, v in zip(self.fields, portion)}
+            })
+        return results
+
+
+class RecommendationCache:
+    """推荐结果缓存
+
+    按LRU淘汰，每条结果有有效期。每个用户有一个版本号，用户吃完一餐或修改资料后
+    调用 invalidate_user() 增加版本号，旧版本的结果不再命中，随后被淘汰。
+    """
+
+    def __init__(self, max_items: int = 4096, ttl_seconds: float = 600.0):
+        """
+        Args:
+            max_items: 最多缓存的结果数
+            ttl_seconds: 结果的有效期（秒）
+        """
+        self.max_items = max(1, int(max_items))
+        self.ttl = float(ttl_seconds)
+        self._items = OrderedDict()
+        self._versions: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, key: Hashable):
+        """查找缓存的结果，未命中时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            full_key = (user_id, self._versions.get(user_id, 0), key)
+            item = self._items.get(full_key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at >= now:
+                    self._items.move_to_end(full_key)
+                    self.hits += 1
+                    return value
+                del self._items[full_key]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, key: Hashable, value):
+        """保存一条结果"""
+        with self._lock:
+            full_key = (user_id, self._versions.get(user_id, 0), key)
+            self._items[full_key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(full_key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """让该用户已缓存的结果失效"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        """命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_items': self.max_items,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
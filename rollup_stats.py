@@ -0,0 +1,148 @@
+"""
+每日统计汇总重建脚本
+每日统计（daily_stats）和用户每日营养摄入（daily_intake）随检测记录和新用户写入增量更新；
+删除检测记录或用户、修改历史数据之后，汇总会与原始数据不一致，可以定期运行本脚本按原始数据重新计算。
+修改 LOCAL_TIMEZONE 后也需要运行一次，按新的时区重新划分每日摄入的日期。
+
+完整重建（不带 --since）后写入重建标记；没有标记的汇总表不会被读取，管理后台和营养分析
+直接按原始表统计。init_db.py 会自动重建还没有标记的汇总表。
+
+菜品、食堂和营养摄入的统计来自 detection_items 表，旧的检测记录请先运行 backfill_items.py。
+
+用法:
+    python rollup_stats.py                    # 重建全部日期
+    python rollup_stats.py --since 2025-01-01 # 只重建该日期及之后
+"""
+import argparse
+import time
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import insert
+
+
+def rebuild_daily_stats(since: date = None) -> dict:
+    """
+    按原始数据重新计算每日统计
+
+    Args:
+        since: 只重建该日期（含）之后的统计，为None时重建全部
+
+    Returns:
+        各项统计写入的行数
+    """
+    from app import ROLLUP_MARKER, app, db, DailyStat, count_daily_stats, mark_rollup_ready
+
+    with app.app_context():
+        counts = count_daily_stats(since)
+        stale = DailyStat.query.filter(DailyStat.metric != ROLLUP_MARKER)
+        if since is not None:
+            stale = stale.filter(DailyStat.day >= since)
+        stale.delete(synchronize_session=False)
+        rows = [{'metric': metric, 'day': day, 'key': key, 'count': count}
+                for (metric, day, key), count in counts.items()]
+        if rows:
+            db.session.execute(insert(DailyStat), rows)
+        if since is None:
+            mark_rollup_ready('daily_stats')
+        db.session.commit()
+
+    return dict(Counter(metric for metric, _, _ in counts))
+
+
+def rebuild_daily_intake(since: date = None, chunk_size: int = 5000) -> int:
+    """
+    按原始数据重新计算用户每日营养摄入
+
+    日期按食堂所在时区（LOCAL_TIMEZONE）划分，与在线写入时的 local_day() 一致；
+    时区换算在数据库中无法通用地完成，因此逐行读取检测时间后在Python中归入对应日期。
+
+    Args:
+        since: 只重建该日期（含）之后的汇总，为None时重建全部
+        chunk_size: 每次从数据库读取的行数
+
+    Returns:
+        写入的行数
+    """
+    from app import (app, db, DailyIntake, DetectionItem, DetectionRecord, NUTRIENT_FIELDS,
+                     local_day, local_midnight_utc, mark_rollup_ready)
+
+    since_time = local_midnight_utc(since) if since is not None else None
+    with app.app_context():
+        totals = {}
+
+        def total_of(user_id, detection_time):
+            key = (user_id, local_day(detection_time))
+            if key not in totals:
+                totals[key] = dict(meals=0, weighed_items=0,
+                                   **dict.fromkeys(NUTRIENT_FIELDS, 0.0))
+            return totals[key]
+
+        query = db.session.query(DetectionRecord.user_id, DetectionRecord.detection_time).filter(
+            DetectionRecord.detection_time.isnot(None))
+        if since_time is not None:
+            query = query.filter(DetectionRecord.detection_time >= since_time)
+        for user_id, detection_time in query.yield_per(chunk_size):
+            total_of(user_id, detection_time)['meals'] += 1
+
+        query = db.session.query(
+            DetectionItem.user_id, DetectionItem.detection_time,
+            *[getattr(DetectionItem, f) for f in NUTRIENT_FIELDS]
+        ).filter(DetectionItem.detection_time.isnot(None), DetectionItem.energy_kcal.isnot(None))
+        if since_time is not None:
+            query = query.filter(DetectionItem.detection_time >= since_time)
+        for user_id, detection_time, *values in query.yield_per(chunk_size):
+            total = total_of(user_id, detection_time)
+            total['weighed_items'] += 1
+            for field, value in zip(NUTRIENT_FIELDS, values):
+                total[field] += value or 0.0
+
+        stale = DailyIntake.query
+        if since is not None:
+            stale = stale.filter(DailyIntake.day >= since)
+        stale.delete(synchronize_session=False)
+        rows = [dict(total, user_id=user_id, day=day)
+                for (user_id, day), total in totals.items()]
+        if rows:
+            db.session.execute(insert(DailyIntake), rows)
+        if since is None:
+            mark_rollup_ready('daily_intake')
+        db.session.commit()
+    return len(rows)
+
+
+def bootstrap_rollups() -> dict:
+    """
+    重建还没有重建标记的汇总表（新部署，或升级后汇总表刚创建），由 init_db.py 调用
+
+    Returns:
+        各项统计写入的行数，两张汇总表都已重建过时为空
+    """
+    from app import app, rollup_ready
+
+    with app.app_context():
+        pending = [table for table in ('daily_stats', 'daily_intake') if not rollup_ready(table)]
+    stats = {}
+    if 'daily_stats' in pending:
+        stats.update(rebuild_daily_stats())
+    if 'daily_intake' in pending:
+        stats['intake'] = rebuild_daily_intake()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按原始数据重建每日统计汇总')
+    parser.add_argument('--since', type=date.fromisoformat, default=None,
+                        help='只重建该日期及之后（YYYY-MM-DD）')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    stats = rebuild_daily_stats(args.since)
+    stats['intake'] = rebuild_daily_intake(args.since)
+    print(f"重建完成（{time.monotonic() - started:.2f} 秒）:")
+    for metric, count in sorted(stats.items()):
+        print(f"  {metric}: {count} 行")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,12 @@
 import numpy as np
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
+from collections import deque
 from scipy.optimize import linear_sum_assignment
+import hashlib
 import json
+import threading
+import time
 
 
 @dataclass
@@ -26,6 +30,8 @@ class DetectedFood:
     center_x: float  # 中心点x坐标
     center_y: float  # 中心点y坐标
     area: float  # 区域面积
+    class_id: int = -1  # YOLO类别ID，未知时为-1
+    image_area: float = 0.0  # 原图面积（像素²），未知时为0
 
 
 @dataclass
@@ -37,15 +43,50 @@ class AlignedFood:
     confidence_score: float  # 对齐置信度
 
 
+# 批量模拟中的异常类型编码
+ANOMALY_CODES = {'none': 0, 'missing': 1, 'extra': 2, 'merged': 3}
+
+
+@dataclass
+class WeightBatch:
+    """批量模拟的重量事件（按餐盘补齐为等长数组）
+
+    第0列是初始的空盘事件，与 simulate_weight_sequence 的输出一致；
+    第 n_events[i] 列之后为填充的0。
+    """
+    timestamps: np.ndarray  # [n_trays, max_events] 时间戳（秒）
+    cumulative: np.ndarray  # [n_trays, max_events] 累积重量（克）
+    deltas: np.ndarray  # [n_trays, max_events] 增量重量（克）
+    n_events: np.ndarray  # [n_trays] 每个餐盘的事件数（含初始事件）
+    event_food: np.ndarray  # [n_trays, max_events] 事件对应的第一个菜品序号，初始事件和误检为-1
+    event_food_count: np.ndarray  # [n_trays, max_events] 事件包含的菜品数：0、1，合并事件为2
+    true_weights: np.ndarray  # [n_trays, max_foods] 各菜品的真实重量，填充为NaN
+    n_foods: np.ndarray  # [n_trays] 每个餐盘的菜品数
+    anomaly: np.ndarray  # [n_trays] 异常类型，见 ANOMALY_CODES
+
+    def __len__(self):
+        return len(self.n_events)
+
+    def events(self, index: int) -> List[WeightEvent]:
+        """第index个餐盘的重量事件序列，可直接传给 VisualWeightAligner.align"""
+        n = int(self.n_events[index])
+        return [WeightEvent(timestamp=float(t), cumulative_weight=float(c), delta_weight=float(d))
+                for t, c, d in zip(self.timestamps[index, :n], self.cumulative[index, :n],
+                                   self.deltas[index, :n])]
+
+
 class WeightSensorSimulator:
     """重量传感器模拟器"""
 
-    def __init__(self, noise_level: float = 0.5):
+    def __init__(self, noise_level: float = 0.5, seed: Optional[int] = None):
         """
         Args:
             noise_level: 噪声水平（克）
+            seed: 随机种子，相同种子生成相同的序列；为None时每次不同
         """
         self.noise_level = noise_level
+        # 每个实例独立的随机数生成器，不受全局 np.random 状态影响
+        self.rng = np.random.default_rng(seed)
 
     def simulate_weight_sequence(self,
                                  food_weights: List[float],
@@ -62,7 +103,7 @@ class WeightSensorSimulator:
         """
         if take_intervals is None:
             # 随机生成取菜时间间隔
-            take_intervals = np.random.uniform(0.5, 2.0, len(food_weights))
+            take_intervals = self.rng.uniform(0.5, 2.0, len(food_weights))
 
         events = []
         cumulative = 0.0
@@ -79,7 +120,7 @@ class WeightSensorSimulator:
             current_time += interval
 
             # 添加噪声
-            noisy_weight = weight + np.random.normal(0, self.noise_level)
+            noisy_weight = weight + self.rng.normal(0, self.noise_level)
             cumulative += noisy_weight
 
             events.append(WeightEvent(
@@ -109,15 +150,15 @@ class WeightSensorSimulator:
         if anomaly_type == 'missing':
             # 随机移除一个重量事件（模拟传感器漏检）
             if len(food_weights) > 1:
-                skip_idx = np.random.randint(0, len(food_weights))
+                skip_idx = self.rng.integers(0, len(food_weights))
                 weights = [w for i, w in enumerate(
                     food_weights) if i != skip_idx]
                 return self.simulate_weight_sequence(weights)
 
         elif anomaly_type == 'extra':
             # 添加额外的噪声事件
-            extra_weight = np.random.uniform(10, 30)
-            insert_pos = np.random.randint(0, len(food_weights))
+            extra_weight = self.rng.uniform(10, 30)
+            insert_pos = self.rng.integers(0, len(food_weights))
             weights = food_weights[:insert_pos] + \
                 [extra_weight] + food_weights[insert_pos:]
             return self.simulate_weight_sequence(weights)
@@ -125,7 +166,7 @@ class WeightSensorSimulator:
         elif anomaly_type == 'merged':
             # 模拟同时取多个菜品
             if len(food_weights) >= 2:
-                merge_idx = np.random.randint(0, len(food_weights) - 1)
+                merge_idx = self.rng.integers(0, len(food_weights) - 1)
                 weights = (food_weights[:merge_idx] +
                            [food_weights[merge_idx] + food_weights[merge_idx + 1]] +
                            food_weights[merge_idx + 2:])
@@ -133,6 +174,255 @@ class WeightSensorSimulator:
 
         return self.simulate_weight_sequence(food_weights)
 
+    def random_food_weights(self, n_trays: int, min_foods: int = 2, max_foods: int = 6,
+                            weight_range: Tuple[float, float] = (30.0, 250.0)
+                            ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        随机生成一批餐盘的菜品重量
+
+        Returns:
+            tuple: (重量 [n_trays, max_foods]，多余位置为NaN, 菜品数 [n_trays])
+        """
+        n_foods = self.rng.integers(min_foods, max_foods + 1, n_trays)
+        weights = self.rng.uniform(weight_range[0], weight_range[1], (n_trays, max_foods))
+        weights[np.arange(max_foods)[None, :] >= n_foods[:, None]] = np.nan
+        return weights, n_foods
+
+    def simulate_batch(self,
+                       food_weights: np.ndarray,
+                       n_foods: np.ndarray = None,
+                       anomaly_probs: Dict[str, float] = None,
+                       take_interval: Tuple[float, float] = (0.5, 2.0),
+                       extra_range: Tuple[float, float] = (10.0, 30.0)) -> WeightBatch:
+        """
+        批量模拟取菜过程，全部餐盘一起用数组运算生成（与 simulate_with_anomalies 的规则相同）
+
+        Args:
+            food_weights: [n_trays, max_foods] 各餐盘菜品的真实重量（按取菜顺序）
+            n_foods: [n_trays] 每个餐盘的菜品数，默认按food_weights中非NaN的个数
+            anomaly_probs: 各异常类型的概率，如 {'missing': 0.1, 'extra': 0.1, 'merged': 0.1}，
+                其余为正常；漏检和合并只发生在至少2个菜品的餐盘上
+            take_interval: 取菜时间间隔的范围（秒）
+            extra_range: 误检事件的重量范围（克）
+
+        Returns:
+            WeightBatch
+        """
+        weights = np.asarray(food_weights, dtype=float)
+        n_trays, max_foods = weights.shape
+        if n_foods is None:
+            n_foods = (~np.isnan(weights)).sum(axis=1)
+        n_foods = np.asarray(n_foods, dtype=int)
+        weights = np.where(np.arange(max_foods)[None, :] < n_foods[:, None],
+                           np.nan_to_num(weights), 0.0)
+        trays = np.arange(n_trays)
+
+        # 每个餐盘抽取一种异常，以及异常发生的位置
+        probs = anomaly_probs or {}
+        kinds = ['none'] + list(probs)
+        p = np.array([max(0.0, 1.0 - sum(probs.values()))] + list(probs.values()))
+        anomaly = np.array([ANOMALY_CODES[k] for k in kinds])[
+            self.rng.choice(len(kinds), n_trays, p=p / p.sum())]
+        anomaly[(n_foods < 2) & ((anomaly == ANOMALY_CODES['missing'])
+                                 | (anomaly == ANOMALY_CODES['merged']))] = ANOMALY_CODES['none']
+        position = (self.rng.random(n_trays) * np.maximum(n_foods, 1)).astype(int)
+        merge_at = (self.rng.random(n_trays) * np.maximum(n_foods - 1, 1)).astype(int)
+        missing = anomaly == ANOMALY_CODES['missing']
+        extra = anomaly == ANOMALY_CODES['extra']
+        merged = anomaly == ANOMALY_CODES['merged']
+
+        # 候选事件：每个菜品一个，外加一个误检事件（排在第position个菜品之前）
+        columns = np.arange(max_foods)[None, :]
+        keep = columns < n_foods[:, None]
+        keep &= ~(missing[:, None] & (columns == position[:, None]))
+        keep &= ~(merged[:, None] & (columns == merge_at[:, None] + 1))
+        event_weights = weights.copy()
+        event_counts = keep.astype(int)
+        head = trays[merged], merge_at[merged]
+        event_weights[head] += weights[trays[merged], merge_at[merged] + 1]
+        event_counts[head] = 2
+
+        sort_key = np.concatenate([np.broadcast_to(columns, keep.shape).astype(float),
+                                   (position - 0.5)[:, None]], axis=1)
+        keep = np.concatenate([keep, extra[:, None]], axis=1)
+        event_weights = np.concatenate(
+            [event_weights, self.rng.uniform(extra_range[0], extra_range[1], (n_trays, 1))], axis=1)
+        event_food = np.concatenate(
+            [np.broadcast_to(columns, (n_trays, max_foods)), np.full((n_trays, 1), -1)], axis=1)
+        event_counts = np.concatenate([event_counts, np.zeros((n_trays, 1), dtype=int)], axis=1)
+
+        # 按取菜顺序排列保留的事件，未保留的排到末尾
+        order = np.argsort(np.where(keep, sort_key, np.inf), axis=1, kind='stable')
+        keep = np.take_along_axis(keep, order, axis=1)
+        deltas = np.take_along_axis(event_weights, order, axis=1)
+        event_food = np.where(keep, np.take_along_axis(event_food, order, axis=1), -1)
+        event_counts = np.where(keep, np.take_along_axis(event_counts, order, axis=1), 0)
+
+        deltas = np.where(keep, deltas + self.rng.normal(0, self.noise_level, deltas.shape), 0.0)
+        intervals = np.where(keep, self.rng.uniform(take_interval[0], take_interval[1],
+                                                    deltas.shape), 0.0)
+
+        # 补上初始的空盘事件
+        def with_initial(values, fill=0):
+            return np.concatenate([np.full((n_trays, 1), fill, dtype=values.dtype), values], axis=1)
+
+        n_events = keep.sum(axis=1) + 1
+        true_weights = np.where(columns < n_foods[:, None], weights, np.nan)
+        return WeightBatch(
+            timestamps=with_initial(np.cumsum(intervals, axis=1) * keep),
+            cumulative=with_initial(np.cumsum(deltas, axis=1) * keep),
+            deltas=with_initial(deltas),
+            n_events=n_events,
+            event_food=with_initial(event_food, -1),
+            event_food_count=with_initial(event_counts),
+            true_weights=true_weights,
+            n_foods=n_foods,
+            anomaly=anomaly
+        )
+
+
+class AreaWeightModel:
+    """按菜品类别的重量回归模型
+
+    在对数空间中做线性回归：
+        log(重量) = b0 + b1·log(面积) + b2·log(宽高比) + b3·log(原图面积)
+    每个类别一组系数，存放在按YOLO类别ID索引的数组中，最后一行是全部类别共用的系数，
+    未知类别或样本不足的类别使用该行。每个菜品的估计只需一次查表和一次点积。
+
+    不加载模型文件时不做回归，直接按 重量 = 0.1 × 面积 估计，与未引入模型前的结果相同。
+    """
+
+    N_FEATURES = 4
+    DEFAULT_DENSITY = 0.1  # 克/像素²
+    MIN_SIDE = 1.0  # 像素；面积、边长低于该值时按该值计算，避免对数为 -inf
+
+    def __init__(self, names: List[str] = None, coef: np.ndarray = None,
+                 reference_image_area: float = 0.0, version: str = None):
+        """
+        Args:
+            names: 按类别ID排列的类别名
+            coef: [len(names) + 1, N_FEATURES] 回归系数，最后一行为共用系数
+            reference_image_area: 原图面积未知时代入的值（训练数据的几何平均）
+            version: 模型版本（系数的摘要），默认模型为None
+        """
+        self.names = list(names or [])
+        self.is_default = coef is None
+        if coef is None:
+            coef = np.zeros((len(self.names) + 1, self.N_FEATURES))
+            coef[:, 0] = np.log(self.DEFAULT_DENSITY)
+            coef[:, 1] = 1.0
+        self.coef = np.asarray(coef, dtype=float)
+        self.reference_image_area = reference_image_area
+        self.version = version
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def rows(self, foods: List[DetectedFood]) -> np.ndarray:
+        """每个菜品使用的系数行：优先按类别ID，其次按类别名，都不认识时为-1（共用系数）"""
+        n = len(self.names)
+        return np.array([
+            food.class_id if 0 <= food.class_id < n and self.names[food.class_id] == food.class_name
+            else self.index.get(food.class_name, -1)
+            for food in foods
+        ], dtype=int)
+
+    def features(self, foods: List[DetectedFood]) -> np.ndarray:
+        """回归特征 [n_foods, N_FEATURES]"""
+        values = np.array([
+            (food.area, food.bbox[2] - food.bbox[0], food.bbox[3] - food.bbox[1],
+             food.image_area) for food in foods
+        ], dtype=float).reshape(-1, 4)
+        area, width, height, image_area = values.T
+        floor = self.MIN_SIDE
+        area = np.maximum(area, floor * floor)
+        aspect = np.maximum(width, floor) / np.maximum(height, floor)
+        image_area = np.where(image_area > 0, image_area, self.reference_image_area or 1.0)
+        image_area = np.maximum(image_area, floor * floor)
+        return np.column_stack([np.ones(len(values)), np.log(area),
+                                np.log(aspect), np.log(image_area)])
+
+    def predict(self, foods: List[DetectedFood]) -> np.ndarray:
+        """
+        估计多个菜品的重量
+
+        Returns:
+            估计重量数组（克） [n_foods]
+        """
+        if not foods:
+            return np.zeros(0)
+        if self.is_default:
+            return np.array([food.area for food in foods], dtype=float) * self.DEFAULT_DENSITY
+        x = self.features(foods)
+        coef = self.coef[self.rows(foods)]
+        return np.exp(np.einsum('ij,ij->i', x, coef))
+
+    @classmethod
+    def fit(cls, samples: List[Tuple[DetectedFood, float]], names: List[str] = None,
+            min_samples: int = 10, ridge: float = 5.0) -> 'AreaWeightModel':
+        """
+        用历史对齐结果拟合模型
+
+        先用全部样本拟合共用系数，再对每个类别做向共用系数收缩的岭回归，
+        样本少的类别会更接近共用系数。截距按对数残差修正，使估计的是重量均值而不是几何均值。
+
+        Args:
+            samples: (菜品, 真实重量) 列表
+            names: 按YOLO类别ID排列的类别名，默认按样本中出现的类别名排序
+            min_samples: 单独拟合系数所需的最少样本数
+            ridge: 收缩强度
+
+        Returns:
+            AreaWeightModel
+        """
+        samples = [(food, w) for food, w in samples if food.area > 0 and w > 0]
+        if not samples:
+            raise ValueError('没有可用的样本')
+        if names is None:
+            names = sorted({food.class_name for food, _ in samples})
+        foods = [food for food, _ in samples]
+        y = np.log(np.array([w for _, w in samples], dtype=float))
+
+        image_areas = np.array([food.image_area for food in foods], dtype=float)
+        known = image_areas > 0
+        reference_image_area = float(np.exp(np.log(image_areas[known]).mean())) if known.any() else 0.0
+        model = cls(names, reference_image_area=reference_image_area)
+        x = model.features(foods)
+        rows = model.rows(foods)
+
+        def solve(x, y, prior, strength):
+            penalty = strength * np.eye(cls.N_FEATURES)
+            beta = np.linalg.solve(x.T @ x + penalty, x.T @ y + penalty @ prior)
+            # 对数空间的回归低估均值，用残差的平均修正截距
+            beta[0] += np.log(np.mean(np.exp(y - x @ beta)))
+            return beta
+
+        prior = model.coef[-1].copy()
+        model.coef[:] = solve(x, y, prior, 1e-3)
+        global_coef = model.coef[-1].copy()
+        for row in range(len(model.names)):
+            mask = rows == row
+            if mask.sum() >= min_samples:
+                model.coef[row] = solve(x[mask], y[mask], global_coef, ridge)
+
+        model.is_default = False
+        model.version = hashlib.sha1(model.coef.astype(np.float32).tobytes()).hexdigest()[:12]
+        return model
+
+    def save(self, path: str):
+        """保存为压缩的 .npz 文件（系数为float32）"""
+        np.savez_compressed(path, names=np.array(self.names, dtype=str),
+                            coef=self.coef.astype(np.float32),
+                            reference_image_area=self.reference_image_area,
+                            version=self.version or '')
+
+    @classmethod
+    def load(cls, path: str) -> 'AreaWeightModel':
+        """从 save() 保存的文件加载"""
+        with np.load(path) as data:
+            return cls(names=[str(n) for n in data['names']],
+                       coef=data['coef'].astype(float),
+                       reference_image_area=float(data['reference_image_area']),
+                       version=str(data['version']) or None)
+
 
 class VisualWeightAligner:
     """视觉-重量对齐算法"""
@@ -140,16 +430,30 @@ class VisualWeightAligner:
     def __init__(self,
                  weight_tolerance: float = 0.2,
                  spatial_weight: float = 0.6,
-                 temporal_weight: float = 0.4):
+                 temporal_weight: float = 0.4,
+                 weight_model: AreaWeightModel = None):
         """
         Args:
             weight_tolerance: 重量匹配容忍度（相对误差）
             spatial_weight: 空间信息权重
             temporal_weight: 时序信息权重
+            weight_model: 由视觉特征估计重量的模型，默认按面积的固定比例估计
         """
         self.weight_tolerance = weight_tolerance
         self.spatial_weight = spatial_weight
         self.temporal_weight = temporal_weight
+        self.weight_model = weight_model or AreaWeightModel()
+
+    def params(self) -> Dict:
+        """对齐参数（用于记录结果是由哪组参数得到的）"""
+        params = {
+            'weight_tolerance': self.weight_tolerance,
+            'spatial_weight': self.spatial_weight,
+            'temporal_weight': self.temporal_weight
+        }
+        if self.weight_model.version:
+            params['weight_model'] = self.weight_model.version
+        return params
 
     def sort_foods_spatially(self, foods: List[DetectedFood],
                              direction: str = 'left_to_right') -> List[DetectedFood]:
@@ -205,7 +509,7 @@ class VisualWeightAligner:
                             foods: List[DetectedFood],
                             weights: List[float]) -> np.ndarray:
         """
-        计算菜品与重量的匹配成本矩阵
+        计算菜品与重量的匹配成本矩阵（NumPy广播实现）
 
         Args:
             foods: 空间排序后的菜品列表
@@ -216,37 +520,84 @@ class VisualWeightAligner:
         """
         n_foods = len(foods)
         n_weights = len(weights)
-        cost_matrix = np.zeros((n_foods, n_weights))
+        if n_foods == 0 or n_weights == 0:
+            return np.zeros((n_foods, n_weights))
+
+        # 重量-面积相关性成本（基于先验知识）
+        # 假设菜品面积与重量有一定相关性
+        expected = self._estimate_weights_from_areas(foods)[:, None]
+        observed = np.asarray(weights, dtype=float)[None, :]
+        weight_cost = np.abs(expected - observed) / \
+            np.maximum(expected, observed)
+
+        # 空间-时序一致性成本（位置越近，成本越低）
+        idx_diff = np.arange(n_foods)[:, None] - np.arange(n_weights)[None, :]
+        spatial_cost = np.abs(idx_diff) / max(n_foods, n_weights)
+
+        # 综合成本
+        return (self.spatial_weight * spatial_cost +
+                self.temporal_weight * weight_cost)
+
+    def compute_cost_matrices(self,
+                              trays: List[Tuple[List[DetectedFood], List[float]]]
+                              ) -> List[np.ndarray]:
+        """
+        批量计算多个餐盘的成本矩阵（离线重对齐等场景）
+
+        所有餐盘填充到相同尺寸后一次广播计算，结果与逐个调用
+        compute_cost_matrix 完全一致。
+
+        Args:
+            trays: (空间排序后的菜品列表, 重量增量列表) 的列表
+
+        Returns:
+            与trays一一对应的成本矩阵列表
+        """
+        if not trays:
+            return []
+
+        n = np.array([len(foods) for foods, _ in trays])
+        m = np.array([len(weights) for _, weights in trays])
+        n_max, m_max = max(int(n.max()), 1), max(int(m.max()), 1)
 
-        for i, food in enumerate(foods):
-            for j, weight in enumerate(weights):
-                # 空间-时序一致性成本（位置越近，成本越低）
-                spatial_cost = abs(i - j) / max(n_foods, n_weights)
+        expected = np.zeros((len(trays), n_max))
+        observed = np.zeros((len(trays), m_max))
+        for b, (foods, weights) in enumerate(trays):
+            if foods:
+                expected[b, :len(foods)] = self._estimate_weights_from_areas(foods)
+            observed[b, :len(weights)] = weights
 
-                # 重量-面积相关性成本（基于先验知识）
-                # 假设菜品面积与重量有一定相关性
-                expected_weight = self._estimate_weight_from_area(food)
-                weight_cost = abs(expected_weight - weight) / \
-                    max(expected_weight, weight)
+        # 填充区域会出现0/0，只影响被裁掉的部分
+        with np.errstate(divide='ignore', invalid='ignore'):
+            e = expected[:, :, None]
+            w = observed[:, None, :]
+            weight_cost = np.abs(e - w) / np.maximum(e, w)
 
-                # 综合成本
-                cost_matrix[i, j] = (self.spatial_weight * spatial_cost +
-                                     self.temporal_weight * weight_cost)
+            idx_diff = np.arange(n_max)[:, None] - np.arange(m_max)[None, :]
+            spatial_cost = np.abs(idx_diff)[None, :, :] / \
+                np.maximum(n, m)[:, None, None]
 
-        return cost_matrix
+        cost = (self.spatial_weight * spatial_cost +
+                self.temporal_weight * weight_cost)
+        return [cost[b, :n[b], :m[b]] for b in range(len(trays))]
 
     def _estimate_weight_from_area(self, food: DetectedFood) -> float:
         """
-        根据视觉特征估计重量（简化模型）
-        实际应用中可以训练一个回归模型
+        根据视觉特征估计重量
 
         Returns:
             估计重量（克）
         """
-        # 简化假设：面积与重量成正比
-        # 这里使用一个经验系数，实际应根据具体菜品调整
-        density_factor = 0.1  # 克/像素²
-        return food.area * density_factor
+        return float(self._estimate_weights_from_areas([food])[0])
+
+    def _estimate_weights_from_areas(self, foods: List[DetectedFood]) -> np.ndarray:
+        """
+        批量估计多个菜品的重量
+
+        Returns:
+            估计重量数组（克） [n_foods]
+        """
+        return self.weight_model.predict(foods)
 
     def align(self,
               foods: List[DetectedFood],
@@ -272,6 +623,19 @@ class VisualWeightAligner:
         # Step 2: 提取重量增量
         weights = self.extract_weight_increments(weight_events)
 
+        return self._align_sorted(sorted_foods, weights, weight_events)
+
+    def _align_sorted(self,
+                      sorted_foods: List[DetectedFood],
+                      weights: List[float],
+                      weight_events: List[WeightEvent],
+                      cost_matrix: np.ndarray = None) -> List[AlignedFood]:
+        """
+        对已空间排序的菜品和已提取的重量增量执行匹配
+
+        Args:
+            cost_matrix: 预先算好的成本矩阵 [len(sorted_foods), len(weights)]，为None时现算
+        """
         if not weights:
             # 没有有效重量数据，返回未匹配结果
             return [AlignedFood(
@@ -287,26 +651,60 @@ class VisualWeightAligner:
         if len(sorted_foods) == len(weights):
             # 理想情况：一对一匹配
             aligned_results = self._one_to_one_alignment(
-                sorted_foods, weights, weight_events)
+                sorted_foods, weights, weight_events, cost_matrix)
 
         elif len(sorted_foods) > len(weights):
             # 视觉检测数量 > 重量事件数量（可能漏检）
             aligned_results = self._handle_missing_weights(
-                sorted_foods, weights, weight_events)
+                sorted_foods, weights, weight_events, cost_matrix)
 
         else:
             # 视觉检测数量 < 重量事件数量（可能误检或合并）
             aligned_results = self._handle_extra_weights(
-                sorted_foods, weights, weight_events)
+                sorted_foods, weights, weight_events, cost_matrix)
 
         return aligned_results
 
+    def align_batch(self,
+                    trays: List[Tuple[List[DetectedFood], List[WeightEvent]]],
+                    sort_direction: str = 'left_to_right') -> List[List[AlignedFood]]:
+        """
+        对齐多个餐盘（离线重对齐、参数评估等场景）
+
+        所有餐盘的成本矩阵由 compute_cost_matrices 一次算出，
+        结果与逐个调用 align 相同。
+
+        Args:
+            trays: (检测到的菜品列表, 重量事件序列) 的列表
+            sort_direction: 空间排序方向
+
+        Returns:
+            与trays一一对应的对齐结果
+        """
+        prepared = [(self.sort_foods_spatially(foods, sort_direction) if foods else [],
+                     self.extract_weight_increments(events))
+                    for foods, events in trays]
+        cost_matrices = iter(self.compute_cost_matrices(
+            [(foods, weights) for foods, weights in prepared if foods and weights]))
+
+        results = []
+        for (foods, weights), (_, events) in zip(prepared, trays):
+            if not foods:
+                results.append([])
+            elif not weights:
+                results.append(self._align_sorted(foods, weights, events))
+            else:
+                results.append(self._align_sorted(foods, weights, events, next(cost_matrices)))
+        return results
+
     def _one_to_one_alignment(self,
                               foods: List[DetectedFood],
                               weights: List[float],
-                              events: List[WeightEvent]) -> List[AlignedFood]:
+                              events: List[WeightEvent],
+                              cost_matrix: np.ndarray = None) -> List[AlignedFood]:
         """一对一匹配（使用匈牙利算法）"""
-        cost_matrix = self.compute_cost_matrix(foods, weights)
+        if cost_matrix is None:
+            cost_matrix = self.compute_cost_matrix(foods, weights)
 
         # 使用匈牙利算法求解最优匹配
         row_ind, col_ind = linear_sum_assignment(cost_matrix)
@@ -326,13 +724,15 @@ class VisualWeightAligner:
     def _handle_missing_weights(self,
                                 foods: List[DetectedFood],
                                 weights: List[float],
-                                events: List[WeightEvent]) -> List[AlignedFood]:
+                                events: List[WeightEvent],
+                                cost_matrix: np.ndarray = None) -> List[AlignedFood]:
         """处理重量数据缺失的情况"""
         aligned = []
 
         # 先对有重量数据的进行匹配
         if weights:
-            cost_matrix = self.compute_cost_matrix(foods, weights)
+            if cost_matrix is None:
+                cost_matrix = self.compute_cost_matrix(foods, weights)
             row_ind, col_ind = linear_sum_assignment(cost_matrix)
 
             matched_food_indices = set(row_ind)
@@ -371,7 +771,8 @@ class VisualWeightAligner:
     def _handle_extra_weights(self,
                               foods: List[DetectedFood],
                               weights: List[float],
-                              events: List[WeightEvent]) -> List[AlignedFood]:
+                              events: List[WeightEvent],
+                              cost_matrix: np.ndarray = None) -> List[AlignedFood]:
         """处理重量数据冗余的情况（可能合并事件）"""
         aligned = []
 
@@ -405,7 +806,8 @@ class VisualWeightAligner:
                 ))
         else:
             # 简单选择最可能的权重
-            cost_matrix = self.compute_cost_matrix(foods, weights)
+            if cost_matrix is None:
+                cost_matrix = self.compute_cost_matrix(foods, weights)
             row_ind, col_ind = linear_sum_assignment(cost_matrix)
 
             for food_idx, weight_idx in zip(row_ind, col_ind):
@@ -420,6 +822,227 @@ class VisualWeightAligner:
         return sorted(aligned, key=lambda x: x.food.center_x)
 
 
+class StreamingStepSegmenter:
+    """在线重量台阶检测器
+
+    逐个接收电子秤的原始读数（50-100Hz），在最近 stable_seconds 秒内读数波动
+    不超过 stable_tolerance 时认为秤已稳定；稳定值与上一个稳定值相差至少
+    min_step 克时输出一个重量事件。每个读数的处理是均摊O(1)的。
+    """
+
+    def __init__(self,
+                 stable_seconds: float = 0.3,
+                 stable_tolerance: float = 1.0,
+                 min_step: float = 2.0):
+        """
+        Args:
+            stable_seconds: 判定稳定所需的持续时间（秒）
+            stable_tolerance: 稳定窗口内允许的最大波动（克）
+            min_step: 视为一次取菜的最小重量变化（克）
+        """
+        self.stable_seconds = stable_seconds
+        self.stable_tolerance = stable_tolerance
+        self.min_step = min_step
+        self.reset()
+
+    def reset(self):
+        """清空状态，开始一个新的餐盘"""
+        self._window = deque()  # (timestamp, weight)
+        self._max = deque()  # 单调递减，队首为窗口最大值
+        self._min = deque()  # 单调递增，队首为窗口最小值
+        self._sum = 0.0
+        self._baseline = None
+        self.events: List[WeightEvent] = []
+
+    def feed(self, timestamp: float, weight: float) -> List[WeightEvent]:
+        """
+        输入一个读数
+
+        Args:
+            timestamp: 读数时间（秒）
+            weight: 秤上的总重量（克）
+
+        Returns:
+            本次新产生的重量事件（通常为空）
+        """
+        self._window.append((timestamp, weight))
+        self._sum += weight
+        while self._max and self._max[-1] < weight:
+            self._max.pop()
+        self._max.append(weight)
+        while self._min and self._min[-1] > weight:
+            self._min.pop()
+        self._min.append(weight)
+
+        # 丢弃窗口之外的旧读数
+        while self._window[-1][0] - self._window[0][0] > self.stable_seconds:
+            _, old = self._window.popleft()
+            self._sum -= old
+            if self._max[0] == old:
+                self._max.popleft()
+            if self._min[0] == old:
+                self._min.popleft()
+
+        window_span = self._window[-1][0] - self._window[0][0]
+        # 窗口时长不足（允许一个采样间隔的误差）或仍在波动时不判断
+        if window_span < self.stable_seconds * 0.9 or \
+                self._max[0] - self._min[0] > self.stable_tolerance:
+            return []
+
+        level = self._sum / len(self._window)
+        settled_at = self._window[0][0]
+        if self._baseline is None:
+            # 第一次稳定：作为初始状态（空盘重量）
+            self._baseline = level
+            event = WeightEvent(timestamp=settled_at,
+                                cumulative_weight=level, delta_weight=0.0)
+        elif abs(level - self._baseline) >= self.min_step:
+            event = WeightEvent(timestamp=settled_at,
+                                cumulative_weight=level,
+                                delta_weight=level - self._baseline)
+            self._baseline = level
+        else:
+            return []
+
+        self.events.append(event)
+        return [event]
+
+    def feed_many(self, samples) -> List[WeightEvent]:
+        """输入多个 (timestamp, weight) 读数，返回新产生的重量事件"""
+        new_events = []
+        for timestamp, weight in samples:
+            new_events.extend(self.feed(float(timestamp), float(weight)))
+        return new_events
+
+
+class WeightStreamRegistry:
+    """按电子秤管理正在进行的重量流
+
+    每台秤（会话）对应一个 StreamingStepSegmenter；长时间没有新读数的会话自动清理。
+    数据保存在进程内存中，多进程部署时同一台秤的请求需要路由到同一进程。
+    """
+
+    def __init__(self, idle_timeout: float = 600.0, **segmenter_kwargs):
+        """
+        Args:
+            idle_timeout: 会话无读数多久后被清理（秒）
+            segmenter_kwargs: 传给 StreamingStepSegmenter 的参数
+        """
+        self.idle_timeout = idle_timeout
+        self.segmenter_kwargs = segmenter_kwargs
+        self._sessions = {}  # key -> (segmenter, lock, last_seen)
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for key in [k for k, (_, _, seen) in self._sessions.items()
+                    if now - seen > self.idle_timeout]:
+            del self._sessions[key]
+
+    def start(self, key) -> StreamingStepSegmenter:
+        """开始（或重新开始）一个会话"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            segmenter = StreamingStepSegmenter(**self.segmenter_kwargs)
+            self._sessions[key] = (segmenter, threading.Lock(), now)
+            return segmenter
+
+    def feed(self, key, samples) -> List[WeightEvent]:
+        """向会话输入读数（会话不存在时自动创建），返回新产生的重量事件"""
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._sessions:
+                self._expire(now)
+                self._sessions[key] = (
+                    StreamingStepSegmenter(**self.segmenter_kwargs),
+                    threading.Lock(), now)
+            segmenter, lock, _ = self._sessions[key]
+            self._sessions[key] = (segmenter, lock, now)
+        with lock:
+            return segmenter.feed_many(samples)
+
+    def events(self, key) -> Optional[List[WeightEvent]]:
+        """会话目前为止的全部重量事件，会话不存在时返回None"""
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is None:
+            return None
+        segmenter, lock, _ = session
+        with lock:
+            return list(segmenter.events)
+
+    def finish(self, key) -> Optional[List[WeightEvent]]:
+        """结束会话并返回全部重量事件"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        segmenter, lock, _ = session
+        with lock:
+            return list(segmenter.events)
+
+
+def events_to_json(events: List[WeightEvent]) -> List[Dict]:
+    """将重量事件序列转换为JSON格式（与 events_from_json 互逆）"""
+    return [{
+        'timestamp': e.timestamp,
+        'cumulative_weight': e.cumulative_weight,
+        'delta_weight': e.delta_weight
+    } for e in events]
+
+
+def foods_from_detections(detections: List[Dict]) -> List[DetectedFood]:
+    """
+    将YOLO检测结果（class、confidence、bbox，以及可选的 class_id、image_size）转换为DetectedFood列表
+
+    Returns:
+        检测到的菜品列表
+    """
+    foods = []
+    for det in detections:
+        bbox = det['bbox']
+        foods.append(DetectedFood(
+            class_name=det['class'],
+            bbox=bbox,
+            confidence=det['confidence'],
+            center_x=(bbox[0] + bbox[2]) / 2,
+            center_y=(bbox[1] + bbox[3]) / 2,
+            area=(bbox[2] - bbox[0]) * (bbox[3] - bbox[1]),
+            class_id=int(det.get('class_id', -1)),
+            image_area=float(np.prod(det['image_size'])) if det.get('image_size') else 0.0
+        ))
+    return foods
+
+
+def events_from_json(weight_data: List[Dict]) -> List[WeightEvent]:
+    """
+    将JSON格式的重量数据（timestamp、cumulative_weight、delta_weight）转换为重量事件序列
+
+    Returns:
+        重量事件序列
+    """
+    return [WeightEvent(
+        timestamp=event_data['timestamp'],
+        cumulative_weight=event_data['cumulative_weight'],
+        delta_weight=event_data.get('delta_weight', 0.0)
+    ) for event_data in weight_data]
+
+
+def aligned_to_dicts(aligned: List[AlignedFood]) -> List[Dict]:
+    """将对齐结果转换为可JSON序列化的字典列表"""
+    return [
+        {
+            'class': a.food.class_name,
+            'weight': round(a.weight, 2),
+            'confidence': round(a.confidence_score, 3),
+            # 确保是布尔值
+            'matched': bool(a.weight_event_index >= 0),
+            'bbox': a.food.bbox
+        }
+        for a in aligned
+    ]
+
+
 class AlignmentEvaluator:
     """对齐结果评估器"""
 
@@ -0,0 +1,332 @@
+"""
+写回缓冲（write-behind）
+检测请求只把要保存的记录放入内存队列即返回，由后台线程按数量或时间阈值合批写入数据库。
+
+写入失败时整批记录追加到本地的溢出文件（每行一条JSON），数据库恢复后自动重新写入，
+因此数据库短暂不可用不会丢失记录；进程被强制结束时，最多丢失尚未到达写入时间的一批记录。
+重放溢出文件的过程中进程退出时，已写入的部分可能被再次写入（至少一次）。
+
+多个进程（如gunicorn的多个worker，或挂载同一个卷的多个容器）可以共用同一个溢出文件：
+追加和取走溢出文件时持有文件锁，取走的记录改名为带主机名和进程号的重放文件，只由该进程重放。
+同一主机上进程退出后遗留的重放文件由其他进程接管；其他主机的重放文件无法判断进程是否存活，
+重放过程中每写入一批都会更新文件的修改时间，超过 claim_timeout 秒没有更新时才接管。
+重放时整批写入失败会逐条重试，仍然无法写入的记录（如引用的用户已被删除）移到死信文件，
+不会阻塞后面的记录。
+"""
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # 非POSIX系统没有文件锁，只能保证单进程内的互斥
+    fcntl = None
+
+# 溢出文件中日期时间字段的标记
+_DATETIME_KEY = '__datetime__'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {_DATETIME_KEY: value.isoformat()}
+    raise TypeError(f'无法序列化 {type(value).__name__}')
+
+
+def _decode(obj):
+    if len(obj) == 1 and _DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[_DATETIME_KEY])
+    return obj
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+class WriteBehindBuffer:
+    """合批写入的内存缓冲队列
+
+    记录为可JSON序列化的字典（允许datetime），由 flush_fn 一次写入一批。
+    """
+
+    def __init__(self, flush_fn: Callable[[List[dict]], None],
+                 max_batch_size: int = 200,
+                 flush_interval: float = 0.5,
+                 max_queue: int = 10000,
+                 spill_path: Optional[str] = None,
+                 retry_interval: float = 5.0,
+                 is_data_error: Optional[Callable[[Exception], bool]] = None,
+                 claim_timeout: float = 300.0):
+        """
+        Args:
+            flush_fn: 写入一批记录的函数，失败时抛出异常
+            max_batch_size: 队列达到该长度时立即写入
+            flush_interval: 第一条记录入队后最多等待多少秒写入
+            max_queue: 队列长度上限，超出时新记录直接写入溢出文件
+            spill_path: 溢出文件路径，为None时写入失败的记录留在队列中重试
+            retry_interval: 写入失败后至少间隔多少秒再重放溢出文件
+            is_data_error: 判断写入异常是否由记录本身引起（重试也不会成功），
+                这类记录在重放时移到死信文件；为None时，同一批中有其他记录写入成功
+                才认为失败的记录有问题
+            claim_timeout: 其他主机（或无法判断进程是否存活）的重放文件超过该秒数
+                没有更新时视为遗留文件并接管
+        """
+        self.flush_fn = flush_fn
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self.is_data_error = is_data_error
+        self.claim_timeout = claim_timeout
+        self._retry_after = 0.0
+        # 主机名中的点和路径分隔符替换掉，保证能从文件名中解析出主机名和进程号
+        self._host = socket.gethostname().replace('.', '-').replace(os.sep, '-') or 'localhost'
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flush_batches': 0,
+            'flush_failures': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'dead_lettered': 0,
+            'last_flush_ms': 0.0,
+            'last_error': None
+        }
+
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True,
+                                        name='write-behind')
+        self._thread.start()
+
+    def put_many(self, rows: List[dict]):
+        """记录入队，队列已满时直接写入溢出文件"""
+        with self._cond:
+            self._stats['enqueued'] += len(rows)
+            if self.spill_path and len(self._queue) + len(rows) > self.max_queue:
+                overflow = rows
+            else:
+                self._queue.extend(rows)
+                overflow = None
+                if len(self._queue) >= self.max_batch_size:
+                    self._cond.notify()
+        if overflow:
+            self._spill(overflow)
+
+    def put(self, row: dict):
+        self.put_many([row])
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait(timeout=self.flush_interval)
+                # 等待积累到一批或者最早的记录等待超时
+                deadline = time.monotonic() + self.flush_interval
+                while (not self._closed and 0 < len(self._queue) < self.max_batch_size
+                       and time.monotonic() < deadline):
+                    self._cond.wait(timeout=deadline - time.monotonic())
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """立即写入队列中的全部记录，并在写入成功后重放溢出文件"""
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._queue.popleft()
+                             for _ in range(min(len(self._queue), self.max_batch_size))]
+                if not batch:
+                    break
+                if self._write(batch) is not None:
+                    if not self.spill_path:
+                        with self._cond:
+                            self._queue.extendleft(reversed(batch))
+                    else:
+                        self._spill(batch)
+                    return
+            self._replay_spill()
+
+    def _write(self, batch: List[dict]) -> Optional[Exception]:
+        """写入一批记录，成功时返回None，失败时返回异常"""
+        started = time.perf_counter()
+        try:
+            self.flush_fn(batch)
+        except Exception as e:
+            self._retry_after = time.monotonic() + self.retry_interval
+            with self._cond:
+                self._stats['flush_failures'] += 1
+                self._stats['last_error'] = str(e)
+            print(f"检测记录写入失败（{len(batch)}条）: {e}")
+            return e
+        with self._cond:
+            self._stats['flushed'] += len(batch)
+            self._stats['flush_batches'] += 1
+            self._stats['last_flush_ms'] = round(
+                (time.perf_counter() - started) * 1000, 2)
+        return None
+
+    @contextmanager
+    def _spill_file_lock(self):
+        """溢出文件的锁：进程内的线程锁加上跨进程的文件锁"""
+        with self._spill_lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            with open(self.spill_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, path: str, rows: List[dict]):
+        """把记录追加到文件（调用方持有 _spill_file_lock）"""
+        with open(path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_encode, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spill(self, rows: List[dict], count: bool = True):
+        """把记录追加到溢出文件"""
+        os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+        with self._spill_file_lock():
+            self._append(self.spill_path, rows)
+        if count:
+            with self._cond:
+                self._stats['spilled'] += len(rows)
+
+    def _orphaned(self, path: str) -> bool:
+        """重放文件的所有者是否已经退出（调用方持有 _spill_file_lock）"""
+        suffix = path[len(self.spill_path) + len('.replay'):]
+        if suffix == '':
+            # 旧版本使用的不带进程号的重放文件
+            return True
+        host, _, pid = suffix[1:].rpartition('.')
+        if host == self._host and pid.isdigit() and fcntl is not None:
+            return not _pid_alive(int(pid))
+        try:
+            return time.time() - os.path.getmtime(path) > self.claim_timeout
+        except OSError:
+            return False
+
+    def _claim_spill(self) -> Optional[str]:
+        """
+        取走待重放的记录，改名为本进程的重放文件
+
+        优先处理本进程上次未完成的重放文件，其次接管已退出进程遗留的重放文件，
+        最后取走溢出文件。
+
+        Returns:
+            本进程的重放文件路径，没有待重放的记录时为None
+        """
+        own_path = f'{self.spill_path}.replay.{self._host}.{os.getpid()}'
+        with self._spill_file_lock():
+            if os.path.exists(own_path):
+                os.utime(own_path)
+                return own_path
+            for path in glob.glob(glob.escape(self.spill_path) + '.replay*'):
+                if self._orphaned(path):
+                    os.replace(path, own_path)
+                    os.utime(own_path)
+                    return own_path
+            if os.path.exists(self.spill_path):
+                os.replace(self.spill_path, own_path)
+                os.utime(own_path)
+                return own_path
+        return None
+
+    def _write_each(self, batch: List[dict]):
+        """
+        整批写入失败后逐条写入
+
+        Returns:
+            tuple: (写入成功的条数, 需要稍后重试的记录, 无法写入的记录)
+        """
+        written, retry, bad = 0, [], []
+        for k, row in enumerate(batch):
+            error = self._write([row])
+            if error is None:
+                written += 1
+            elif self.is_data_error is None:
+                retry.append(row)
+            elif self.is_data_error(error):
+                bad.append(row)
+            else:
+                # 数据库不可用，剩下的记录不必再逐条尝试
+                retry.extend(batch[k:])
+                break
+        if self.is_data_error is None and written:
+            # 无法区分异常类型时，同一批中别的记录能写入说明数据库可用
+            bad, retry = retry, []
+        return written, retry, bad
+
+    def _replay_spill(self):
+        """重新写入溢出文件中的记录（调用方持有 _flush_lock）"""
+        if not self.spill_path or time.monotonic() < self._retry_after:
+            return
+        replay_path = self._claim_spill()
+        if replay_path is None:
+            return
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line, object_hook=_decode) for line in f if line.strip()]
+
+        for start in range(0, len(rows), self.max_batch_size):
+            batch = rows[start:start + self.max_batch_size]
+            if self._write(batch) is None:
+                written, retry, bad = len(batch), [], []
+            else:
+                written, retry, bad = self._write_each(batch)
+            if bad:
+                with self._spill_file_lock():
+                    self._append(self.spill_path + '.dead', bad)
+                print(f"{len(bad)} 条检测记录无法写入，已移到 {self.spill_path}.dead")
+            with self._cond:
+                self._stats['replayed'] += written
+                self._stats['dead_lettered'] += len(bad)
+            if retry:
+                # 未写入的部分放回溢出文件，下次再试
+                self._spill(retry + rows[start + len(batch):], count=False)
+                break
+            # 表明重放仍在进行，其他主机不会接管
+            os.utime(replay_path)
+        os.remove(replay_path)
+
+    def close(self, timeout: float = 10.0):
+        """写入剩余记录并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """队列深度和写入统计"""
+        with self._cond:
+            data = dict(self._stats, queue_depth=len(self._queue))
+        data['spill_pending'] = bool(
+            self.spill_path and (os.path.exists(self.spill_path)
+                                 or glob.glob(glob.escape(self.spill_path) + '.replay*')))
+        return data